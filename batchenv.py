@@ -0,0 +1,165 @@
+# batchenv.py
+
+import numpy as np
+from board import BOARD_WIDTH, BOARD_HEIGHT, SHAPE_CELLS
+from shapes import ALL_SHAPES, SHAPE_COLORS
+
+HAND_SIZE = 3
+MAX_CELLS = max(len(cells) for cells in SHAPE_CELLS.values())
+
+# Shapes are referred to by their index in ALL_SHAPES; cell tables are padded to MAX_CELLS
+SHAPE_SIZES = np.array([len(SHAPE_CELLS[shape]) for shape in ALL_SHAPES], dtype=np.int64)
+SHAPE_COLOR_VALUES = np.array([SHAPE_COLORS[shape] for shape in ALL_SHAPES], dtype=np.uint8)
+CELL_ROWS = np.zeros((len(ALL_SHAPES), MAX_CELLS), dtype=np.int64)
+CELL_COLS = np.zeros((len(ALL_SHAPES), MAX_CELLS), dtype=np.int64)
+CELL_VALID = np.zeros((len(ALL_SHAPES), MAX_CELLS), dtype=bool)
+for index, shape in enumerate(ALL_SHAPES):
+    for cell, (row, col) in enumerate(SHAPE_CELLS[shape]):
+        CELL_ROWS[index, cell] = row
+        CELL_COLS[index, cell] = col
+        CELL_VALID[index, cell] = True
+
+
+def legal_anchor_masks(occupied):
+    """
+    For a (K, 10, 10) occupancy array return a (K, num_shapes, 10, 10) boolean array whose
+    [k, s, y, x] entry says whether shape s can be placed at (x, y) in game k.
+    """
+    free = ~occupied
+    legal = np.zeros((occupied.shape[0], len(ALL_SHAPES), BOARD_HEIGHT, BOARD_WIDTH), dtype=bool)
+    for index, shape in enumerate(ALL_SHAPES):
+        cells = SHAPE_CELLS[shape]
+        height = max(row for row, _ in cells) + 1
+        width = max(col for _, col in cells) + 1
+        fits = np.ones((occupied.shape[0], BOARD_HEIGHT - height + 1, BOARD_WIDTH - width + 1), dtype=bool)
+        for row, col in cells:
+            fits &= free[:, row:row + BOARD_HEIGHT - height + 1, col:col + BOARD_WIDTH - width + 1]
+        legal[:, index, :BOARD_HEIGHT - height + 1, :BOARD_WIDTH - width + 1] = fits
+    return legal
+
+
+def shape_capacity_batch(occupied):
+    """
+    Board.shape_capacity for a whole (K, 10, 10) occupancy array at once: for every shape,
+    correlate the occupied mask with the shape's blocks over the anchors with x, y < 9.
+    Returns a length-K int array.
+    """
+    capacity = np.zeros(occupied.shape[0], dtype=np.int64)
+    for shape in ALL_SHAPES:
+        cells = SHAPE_CELLS[shape]
+        rows = min(BOARD_HEIGHT - max(row for row, _ in cells), BOARD_HEIGHT - 1)
+        cols = min(BOARD_WIDTH - max(col for _, col in cells), BOARD_WIDTH - 1)
+        fits = np.ones((occupied.shape[0], rows, cols), dtype=bool)
+        for row, col in cells:
+            fits &= occupied[:, row:row + rows, col:col + cols]
+        capacity += fits.sum(axis=(1, 2))
+    return capacity
+
+
+class BatchEnv:
+    """
+    K games stepped together with array operations. grids is a (K, 10, 10) uint8 array of
+    colors, like Board.grid, and hands holds the ALL_SHAPES index of each piece left in a
+    game's hand, or -1 once it has been played. Placement, line clearing and rewards
+    follow Board.simulate_place_shape and Board.clear_complete_lines.
+    """
+
+    def __init__(self, num_games, seed=None):
+        self.num_games = num_games
+        self.rng = np.random.default_rng(seed)
+        self.grids = np.zeros((num_games, BOARD_HEIGHT, BOARD_WIDTH), dtype=np.uint8)
+        self.scores = np.zeros(num_games, dtype=np.int64)
+        self.hands = np.full((num_games, HAND_SIZE), -1, dtype=np.int64)
+        self.done = np.zeros(num_games, dtype=bool)
+        self.reset()
+
+    def reset(self, games=None):
+        """Start new games, either all of them or those selected by an index or boolean array."""
+        games = np.arange(self.num_games) if games is None else games
+        self.grids[games] = 0
+        self.scores[games] = 0
+        self.done[games] = False
+        self.hands[games] = self.rng.integers(len(ALL_SHAPES), size=self.hands[games].shape)
+        self.update_done()
+
+    def observations(self):
+        """Return the binary occupancy of every board as a (K, 1, 10, 10) float32 array for GameCNN."""
+        return (self.grids > 0).astype(np.float32)[:, None]
+
+    def legal_moves(self):
+        """
+        Return a (K, 3, 10, 10) boolean array of the legal (x, y) anchors of every hand slot;
+        slots that have already been played have no legal anchors.
+        """
+        legal = legal_anchor_masks(self.grids > 0)
+        games = np.arange(self.num_games)[:, None]
+        hand_legal = legal[games, np.maximum(self.hands, 0)]
+        hand_legal[self.hands < 0] = False
+        return hand_legal
+
+    def update_done(self):
+        self.done |= ~self.legal_moves().any(axis=(1, 2, 3))
+
+    def sample_random_moves(self):
+        """Pick a uniformly random legal (slot, x, y) for every game; games without one get slot -1."""
+        legal = self.legal_moves().reshape(self.num_games, -1)
+        choice = np.argmax(self.rng.random(legal.shape) * legal, axis=1)
+        slots, ys, xs = np.unravel_index(choice, (HAND_SIZE, BOARD_HEIGHT, BOARD_WIDTH))
+        slots = np.where(legal.any(axis=1), slots, -1)
+        return slots, xs, ys
+
+    def step(self, slots, xs, ys):
+        """
+        Play hand slot slots[k] at (xs[k], ys[k]) in every game k. Invalid moves, and moves
+        in finished games, leave the game unchanged.
+        Returns (rewards, lines_cleared, valid) arrays of length K.
+        """
+        slots = np.asarray(slots, dtype=np.int64)
+        xs = np.asarray(xs, dtype=np.int64)
+        ys = np.asarray(ys, dtype=np.int64)
+        games = np.arange(self.num_games)
+
+        in_hand = (slots >= 0) & (slots < HAND_SIZE) & ~self.done
+        shapes = np.where(in_hand, self.hands[games, np.clip(slots, 0, HAND_SIZE - 1)], -1)
+        valid = shapes >= 0
+        shape_index = np.maximum(shapes, 0)
+
+        cell_valid = CELL_VALID[shape_index]
+        rows = ys[:, None] + CELL_ROWS[shape_index]
+        cols = xs[:, None] + CELL_COLS[shape_index]
+        in_bounds = (rows >= 0) & (rows < BOARD_HEIGHT) & (cols >= 0) & (cols < BOARD_WIDTH)
+        valid &= (in_bounds | ~cell_valid).all(axis=1)
+        rows = np.clip(rows, 0, BOARD_HEIGHT - 1)
+        cols = np.clip(cols, 0, BOARD_WIDTH - 1)
+        valid &= ~((self.grids[games[:, None], rows, cols] > 0) & cell_valid).any(axis=1)
+
+        # Place the shapes of the valid moves
+        placed = cell_valid & valid[:, None]
+        place_games = np.broadcast_to(games[:, None], placed.shape)[placed]
+        self.grids[place_games, rows[placed], cols[placed]] = np.broadcast_to(
+            SHAPE_COLOR_VALUES[shape_index][:, None], placed.shape)[placed]
+
+        # Rows are cleared before columns are checked, so columns only count without a full row
+        occupied = self.grids > 0
+        full_rows = occupied.all(axis=2) & valid[:, None]
+        full_cols = occupied.all(axis=1) & valid[:, None] & ~full_rows.any(axis=1)[:, None]
+        self.grids[full_rows[:, :, None] | full_cols[:, None, :]] = 0
+        lines_cleared = full_rows.sum(axis=1) + full_cols.sum(axis=1)
+
+        # Density bonus: occupied cells in the row and column of every block, after clearing
+        occupied = self.grids > 0
+        row_counts = occupied.sum(axis=2)
+        col_counts = occupied.sum(axis=1)
+        density = ((row_counts[games[:, None], rows] + col_counts[games[:, None], cols]) * cell_valid).sum(axis=1)
+
+        rewards = np.where(valid, (lines_cleared * 10 - SHAPE_SIZES[shape_index]) * 100 + density * 10, 0)
+        self.scores += np.where(valid, SHAPE_SIZES[shape_index], 0)
+
+        # Use up the played slot and deal a new hand once all three are gone
+        played = games[valid]
+        self.hands[played, slots[valid]] = -1
+        empty = (self.hands < 0).all(axis=1) & ~self.done
+        self.hands[empty] = self.rng.integers(len(ALL_SHAPES), size=(int(empty.sum()), HAND_SIZE))
+        self.update_done()
+
+        return rewards, lines_cleared, valid
@@ -0,0 +1,305 @@
+# benchmark.py
+
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from board import Board, bits_to_grid, grid_to_bits
+from bitboard import BitBoard
+from shapes import ALL_SHAPES, SHAPE_COLORS
+from gameAPI import GameAPI, GreedyHeuristicAgent
+from headless import play_one_game, percentile
+from selfplay import AGENT_CLASSES, BOARD_CLASSES
+
+FIXTURES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_fixtures.json')
+MODEL_PATH = 'game_cnn_model.pth'
+# Agents that need the checkpoint at MODEL_PATH and are skipped without it
+CHECKPOINT_AGENTS = ('DeepAgent', 'DeepBellmanAgent', 'MCTSAgent')
+# Agents too slow to time over the default number of moves
+AGENT_MOVES = {'LookaheadRolloutAgent': 5, 'ExpectimaxAgent': 10, 'MCTSAgent': 10}
+
+
+def make_fixtures(seed=0, games=4, every=5):
+    """
+    Play seeded GreedyHeuristicAgent games and keep every `every`-th board, as occupancy
+    bits, so the primitives are timed on realistic fill levels.
+    """
+    random.seed(seed)
+    api = GameAPI(BitBoard(), ALL_SHAPES, SHAPE_COLORS)
+    agent = GreedyHeuristicAgent(api)
+    boards = []
+    for _ in range(games):
+        moves = 0
+        while True:
+            if not agent.next_shapes:
+                agent.next_shapes = api.get_new_shapes(3)
+            if moves % every == 0:
+                boards.append(grid_to_bits(api.board.grid))
+            if not agent.play_turn():
+                break
+            moves += 1
+        api.reset_game()
+    return boards
+
+
+def load_fixtures(path=FIXTURES_PATH):
+    """Read the saved fixture boards, creating the file on first use. Returns a list of grids."""
+    if not os.path.exists(path):
+        with open(path, 'w') as file:
+            json.dump({'seed': 0, 'boards': [hex(bits) for bits in make_fixtures()]}, file, indent=0)
+    with open(path) as file:
+        return [bits_to_grid(int(bits, 16)) for bits in json.load(file)['boards']]
+
+
+def measure(function, repeats=5, min_time=0.2):
+    """
+    Time function() (which performs `ops` operations and returns that count) and return the
+    best operations per second over `repeats` runs of at least min_time seconds each.
+    """
+    best = 0.0
+    for _ in range(repeats):
+        ops = 0
+        start = time.perf_counter()
+        while True:
+            ops += function()
+            elapsed = time.perf_counter() - start
+            if elapsed >= min_time:
+                break
+        best = max(best, ops / elapsed)
+    return best
+
+
+def rate(value, unit='ops/sec'):
+    return {'value': value, 'unit': unit, 'higher_is_better': True}
+
+
+def latency(value, unit='ms'):
+    return {'value': value, 'unit': unit, 'higher_is_better': False}
+
+
+def bench_primitives(fixtures, repeats):
+    """Board primitives over every fixture board, for each board class."""
+    results = {}
+    for name, board_class in BOARD_CLASSES.items():
+        boards = []
+        for grid in fixtures:
+            board = board_class()
+            board.grid = [row[:] for row in grid]
+            boards.append(board)
+        placements = [(board, shape, x, y) for board in boards for shape in ALL_SHAPES
+                      for x, y in board.legal_positions(shape)]
+
+        def can_place():
+            for board in boards:
+                for shape in ALL_SHAPES:
+                    for x in range(10):
+                        for y in range(10):
+                            board.can_place_shape(shape, x, y)
+            return len(boards) * len(ALL_SHAPES) * 100
+
+        def simulate():
+            for board, shape, x, y in placements:
+                board.simulate_place_shape(shape, x, y, 1)
+            return len(placements)
+
+        def capacity():
+            for board in boards:
+                board.shape_capacity(board.grid)
+            return len(boards)
+
+        def clear_lines():
+            # Fill the first row and column of every board, then clear them
+            for board, grid in zip(boards, fixtures):
+                filled = [row[:] for row in grid]
+                filled[0] = [1] * 10
+                for row in filled:
+                    row[0] = 1
+                board.grid = filled
+                board.clear_complete_lines()
+            return len(boards)
+
+        results[f'{name}.can_place_shape'] = rate(measure(can_place, repeats))
+        results[f'{name}.simulate_place_shape'] = rate(measure(simulate, repeats))
+        results[f'{name}.shape_capacity'] = rate(measure(capacity, repeats))
+        results[f'{name}.clear_complete_lines'] = rate(measure(clear_lines, repeats))
+
+        apis = [GameAPI(board, ALL_SHAPES, SHAPE_COLORS) for board in boards]
+        for board, grid in zip(boards, fixtures):
+            board.grid = [row[:] for row in grid]
+
+        def valid_positions():
+            for api in apis:
+                for shape in ALL_SHAPES:
+                    api.get_valid_positions(shape)
+            return len(apis) * len(ALL_SHAPES)
+
+        results[f'{name}.get_valid_positions'] = rate(measure(valid_positions, repeats))
+    return results
+
+
+def bench_agents(seed, moves):
+    """Per-move latency of every agent class over seeded games, restarting finished games."""
+    results = {}
+    for name, agent_class in AGENT_CLASSES.items():
+        if name in CHECKPOINT_AGENTS and not os.path.exists(MODEL_PATH):
+            continue
+        random.seed(seed)
+        # The API deals from its own seeded RNG, so agents that draw random numbers see the same shapes
+        api = GameAPI(Board(), ALL_SHAPES, SHAPE_COLORS, seed=seed)
+        agent = agent_class(api)
+        timings = []
+        while len(timings) < AGENT_MOVES.get(name, moves):
+            if not agent.next_shapes:
+                agent.next_shapes = api.get_new_shapes(3)
+            start = time.perf_counter()
+            played = agent.play_turn()
+            elapsed = time.perf_counter() - start
+            if played:
+                timings.append(elapsed)
+            else:
+                # The turn that finds no legal move is not a move; leave it out of the timings
+                api.reset_game()
+        timings.sort()
+        results[f'agent.{name}.mean'] = latency(sum(timings) / len(timings) * 1000)
+        results[f'agent.{name}.p95'] = latency(percentile(timings, 95) * 1000)
+        if hasattr(agent, 'close'):
+            agent.close()
+    return results
+
+
+def bench_selfplay(seed, games):
+    """Headless self-play games per second with GreedyHeuristicAgent on each board class."""
+    results = {}
+    for name, board_class in BOARD_CLASSES.items():
+        api = GameAPI(board_class(), ALL_SHAPES, SHAPE_COLORS, seed=seed)
+        agent = GreedyHeuristicAgent(api)
+        start = time.perf_counter()
+        for _ in range(games):
+            play_one_game(agent)
+            api.reset_game()
+        results[f'selfplay.{name}.games_per_sec'] = rate(games / (time.perf_counter() - start),
+                                                                         'games/sec')
+    return results
+
+
+def bench_dataset(seed, repeats, samples=20000, batch_size=512):
+    """GameDataset construction and iteration through a DataLoader, in samples per second."""
+    import numpy as np
+    from torch.utils.data import DataLoader
+    from dataLoaders import GameDataset, RangeBatchSampler
+
+    rng = np.random.default_rng(seed)
+    boards = (rng.random((samples, 10, 10)) < 0.4).astype(int).tolist()
+    scores = rng.integers(0, 2000, samples).tolist()
+    data = [{'board_state': board, 'remaining_score': score} for board, score in zip(boards, scores)]
+
+    def build():
+        GameDataset(data)
+        return samples
+
+    dataset = GameDataset(data)
+    loader = DataLoader(dataset, batch_size=None, sampler=RangeBatchSampler(len(dataset), batch_size, shuffle=True))
+
+    def iterate():
+        count = 0
+        for inputs, labels in loader:
+            count += len(inputs)
+        return count
+
+    return {
+        'GameDataset.build': rate(measure(build, repeats), 'samples/sec'),
+        'GameDataset.iterate': rate(measure(iterate, repeats), 'samples/sec'),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run(seed=0, repeats=5, moves=30, games=5, only=None):
+    """Run the selected benchmark groups and return {'meta': ..., 'results': {name: result}}."""
+    fixtures = load_fixtures()
+    groups = {
+        'primitives': lambda: bench_primitives(fixtures, repeats),
+        'agents': lambda: bench_agents(seed, moves),
+        'selfplay': lambda: bench_selfplay(seed, games),
+        'dataset': lambda: bench_dataset(seed, repeats),
+    }
+    results = {}
+    for name, group in groups.items():
+        if only and name not in only:
+            continue
+        print(f"Running {name} benchmarks...", file=sys.stderr)
+        results.update(group())
+    return {
+        'meta': {
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'seed': seed,
+            'fixtures': len(fixtures),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'results': results,
+    }
+
+
+def compare(results, baseline, threshold=0.1):
+    """
+    Compare results against a baseline run. Returns rows of (name, baseline, current,
+    change, regressed) where change is the relative improvement (negative means slower)
+    and regressed flags a change worse than -threshold.
+    """
+    rows = []
+    for name, result in results['results'].items():
+        base = baseline['results'].get(name)
+        if base is None or not base['value']:
+            continue
+        change = result['value'] / base['value'] - 1
+        if not result['higher_is_better']:
+            change = base['value'] / result['value'] - 1 if result['value'] else 0.0
+        rows.append((name, base['value'], result['value'], change, change < -threshold))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the board, agents, self-play and data loading.")
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--baseline', help="results JSON of an earlier run to compare against")
+    parser.add_argument('--threshold', type=float, default=0.1, help="relative slowdown reported as a regression")
+    parser.add_argument('--only', nargs='+', choices=('primitives', 'agents', 'selfplay', 'dataset'))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--moves', type=int, default=30, help="moves timed per agent")
+    parser.add_argument('--games', type=int, default=5, help="self-play games per board class")
+    args = parser.parse_args()
+
+    results = run(args.seed, args.repeats, args.moves, args.games, args.only)
+    with open(args.output, 'w') as file:
+        json.dump(results, file, indent=2)
+
+    for name, result in results['results'].items():
+        print(f"{name:<45} {result['value']:>14.2f} {result['unit']}")
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        rows = compare(results, baseline, args.threshold)
+        print(f"\nCompared with {args.baseline} (commit {baseline['meta'].get('commit')}):")
+        for name, base, current, change, regressed in rows:
+            print(f"{name:<45} {base:>12.2f} -> {current:>12.2f} {change:+7.1%}{'  REGRESSION' if regressed else ''}")
+        if any(row[4] for row in rows):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+# bitboard.py
+
+from board import (Board, BOARD_WIDTH, BOARD_HEIGHT, SHAPE_CELLS, ROW_MASKS, COL_MASKS, SHAPE_MASKS,
+                   grid_to_bits)
+from shapes import ALL_SHAPES
+
+SHAPE_SIZES = {shape: len(SHAPE_CELLS[shape]) for shape in ALL_SHAPES}
+
+
+class BitGrid(list):
+    """
+    A list-of-lists color grid that also carries its occupancy bitboard, so it can be
+    handed to code written against Board.grid while the bitboard stays available.
+    """
+    __slots__ = ('bits',)
+
+    def __init__(self, rows=(), bits=None):
+        super().__init__(rows)
+        self.bits = grid_to_bits(list(self)) if bits is None else bits
+
+    def copy(self):
+        return BitGrid([row[:] for row in self], self.bits)
+
+
+class SimulatedGrid:
+    """
+    Afterstate grid returned by BitBoard.simulate_place_shape. Its occupancy is computed on
+    the bitboard up front, while the color rows are only built the first time they are
+    read: most afterstates are scored from their bits and then discarded. It shares the
+    board's row lists until then, which BitBoard never writes in place.
+    """
+    __slots__ = ('bits', 'source', 'placed', 'shape', 'x', 'y', 'color', '_rows')
+
+    def __init__(self, source, placed, bits, shape, x, y, color):
+        self.source = tuple(source)
+        self.placed = placed  # occupancy with the shape placed, before lines are cleared
+        self.bits = bits
+        self.shape = shape
+        self.x = x
+        self.y = y
+        self.color = color
+        self._rows = None
+
+    @property
+    def rows(self):
+        if self._rows is None:
+            rows = [row[:] for row in self.source]
+            for row, col in SHAPE_CELLS[self.shape]:
+                rows[row + self.y][col + self.x] = self.color
+            clear_lines(rows, self.placed)
+            self._rows = rows
+        return self._rows
+
+    def __len__(self):
+        return BOARD_HEIGHT
+
+    def __getitem__(self, index):
+        return self.rows[index]
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def __eq__(self, other):
+        return self.rows == list(other)
+
+    def copy(self):
+        return BitGrid([row[:] for row in self.rows], self.bits)
+
+
+def find_complete_lines(bits):
+    """
+    Return the complete rows and columns of a bitboard.
+    Board.clear_complete_lines clears rows before it looks at columns, and a cleared row
+    leaves a hole in every column, so columns only count when no row is complete.
+    """
+    rows = [row for row in range(BOARD_HEIGHT) if bits & ROW_MASKS[row] == ROW_MASKS[row]]
+    if rows:
+        return rows, []
+    cols = [col for col in range(BOARD_WIDTH) if bits & COL_MASKS[col] == COL_MASKS[col]]
+    return rows, cols
+
+
+def clear_bits(bits):
+    """Clear complete lines from a bitboard alone. Returns (bits, lines_cleared)."""
+    rows, cols = find_complete_lines(bits)
+    for row in rows:
+        bits &= ~ROW_MASKS[row]
+    for col in cols:
+        bits &= ~COL_MASKS[col]
+    return bits, len(rows) + len(cols)
+
+
+def clear_lines(grid, bits):
+    """
+    Clear complete lines from a color grid and its bitboard. Returns (bits, lines_cleared).
+    Changed rows are replaced rather than written in place, so a SimulatedGrid sharing
+    them keeps its contents.
+    """
+    rows, cols = find_complete_lines(bits)
+    for row in rows:
+        bits &= ~ROW_MASKS[row]
+        grid[row] = [0] * BOARD_WIDTH
+    for col in cols:
+        bits &= ~COL_MASKS[col]
+        for index, grid_row in enumerate(grid):
+            grid[index] = grid_row[:col] + [0] + grid_row[col + 1:]
+    return bits, len(rows) + len(cols)
+
+
+def density_bonus(bits, shape, x, y):
+    """Count the occupied cells in the row and column of every block of the shape."""
+    density_reward = 0
+    for row, col in SHAPE_CELLS[shape]:
+        density_reward += (bits & ROW_MASKS[row + y]).bit_count()
+        density_reward += (bits & COL_MASKS[col + x]).bit_count()
+    return density_reward
+
+
+def simulate_bits(bits, shape, x, y):
+    """
+    Place a shape on a bitboard and clear lines, scoring it like Board.simulate_place_shape.
+    Returns (bits, lines_cleared, reward), or None if the placement is not valid.
+    """
+    mask = SHAPE_MASKS[shape].get((x, y))
+    if mask is None or bits & mask:
+        return None
+    bits, lines_cleared = clear_bits(bits | mask)
+    reward = (lines_cleared * 10 - SHAPE_SIZES[shape]) * 100 + density_bonus(bits, shape, x, y) * 10
+    return (bits, lines_cleared, reward)
+
+
+class BitBoard(Board):
+    """
+    Board backend that keeps the occupancy of the 10x10 grid in a single integer.
+    The color values are kept alongside only for rendering, so GameAPI, the agents
+    and Board.draw keep working on `grid` unchanged; simulated placements only build
+    their color grid when it is read (see SimulatedGrid).
+    Mutate the board through place_shape / clear_complete_lines / clear_board so the
+    bitboard stays in sync with the color plane.
+    """
+
+    @property
+    def grid(self):
+        return self._grid
+
+    @grid.setter
+    def grid(self, grid):
+        self._grid = grid if isinstance(grid, BitGrid) else BitGrid(grid)
+
+    @property
+    def bits(self):
+        return self._grid.bits
+
+    # Fill counts of Board, read straight off the bitboard
+    @property
+    def row_counts(self):
+        return [(self.bits & mask).bit_count() for mask in ROW_MASKS]
+
+    @property
+    def col_counts(self):
+        return [(self.bits & mask).bit_count() for mask in COL_MASKS]
+
+    @property
+    def filled(self):
+        return self.bits.bit_count()
+
+    # Board's cached legal-placement masks follow the bitboard
+    @property
+    def occupancy(self):
+        return self.bits
+
+    def can_place_shape(self, shape, x, y, grid=None):
+        mask = SHAPE_MASKS[shape].get((x, y))
+        if mask is None:
+            return False
+        bits = grid_to_bits(grid) if grid else self.bits
+        return not bits & mask
+
+    def legal_positions(self, shape, grid=None):
+        bits = grid_to_bits(grid) if grid else self.bits
+        return [position for position, mask in SHAPE_MASKS[shape].items() if not bits & mask]
+
+    def place_shape(self, shape, x, y, color):
+        if not self.can_place_shape(shape, x, y):
+            return False
+
+        grid = self._grid
+        cells = SHAPE_CELLS[shape]
+        # Copy the touched rows before painting them, since simulated grids may share them
+        for row in {row + y for row, _ in cells}:
+            grid[row] = grid[row][:]
+        for row, col in cells:
+            grid[row + y][col + x] = color
+        grid.bits |= SHAPE_MASKS[shape][(x, y)]
+
+        self.clear_complete_lines()
+        return True
+
+    def simulate_place_shape(self, shape, x, y, color, grid=None):
+        bits = grid_to_bits(grid) if grid else self.bits
+        mask = SHAPE_MASKS[shape].get((x, y))
+        if mask is None or bits & mask:
+            return None
+
+        if grid:
+            # A grid handed in is updated in place, as Board does
+            simulated_board = grid
+            for row, col in SHAPE_CELLS[shape]:
+                simulated_board[row + y][col + x] = color
+            bits, lines_cleared = clear_lines(simulated_board, bits | mask)
+            if isinstance(simulated_board, BitGrid):
+                simulated_board.bits = bits
+        else:
+            placed = bits | mask
+            bits, lines_cleared = clear_bits(placed)
+            simulated_board = SimulatedGrid(self._grid, placed, bits, shape, x, y, color)
+
+        reward = (lines_cleared * 10 - SHAPE_SIZES[shape]) * 100 + density_bonus(bits, shape, x, y) * 10
+        return (simulated_board, lines_cleared, reward)
+
+    def get_density_reward_bonus(self, shape, x, y, color, grid=None):
+        bits = grid_to_bits(grid) if grid else self.bits
+        return density_bonus(bits, shape, x, y)
+
+    def clear_complete_lines(self, grid=None):
+        grid_to_clear = grid if grid else self._grid
+        bits, lines_cleared = clear_lines(grid_to_clear, grid_to_bits(grid_to_clear))
+        if isinstance(grid_to_clear, BitGrid):
+            grid_to_clear.bits = bits
+        return lines_cleared
+
+    def empty_cells(self, grid):
+        return BOARD_WIDTH * BOARD_HEIGHT - grid_to_bits(grid).bit_count()
@@ -1,8 +1,8 @@
-import pygame
 import random
 from shapes import ALL_SHAPES
-from model import load_model
-import torch
+
+# torch is imported on the first Board.init_model, so agents without the CNN never load it
+torch = None
 
 # Constants
 BOARD_WIDTH = 10
@@ -21,16 +21,181 @@ BOARD_START_X = (SCREEN_WIDTH - (BOARD_WIDTH * BLOCK_SIZE)) // 2
 BOARD_START_Y = 50
 
 
+def shape_cells(shape):
+    """Return the (row, col) offsets of the filled blocks of a shape."""
+    return tuple((row, col) for row in range(len(shape)) for col in range(len(shape[row])) if shape[row][col])
+
+
+def shape_anchors(shape):
+    """
+    Return every (x, y) offset at which the shape lies fully inside the board.
+    Offsets are listed x-major, the order in which moves have always been enumerated.
+    """
+    cells = shape_cells(shape)
+    height = max(row for row, _ in cells) + 1
+    width = max(col for _, col in cells) + 1
+    return tuple((x, y) for x in range(BOARD_WIDTH - width + 1) for y in range(BOARD_HEIGHT - height + 1))
+
+
+# Built once at import so move generation never has to bounds-check an offset
+SHAPE_CELLS = {shape: shape_cells(shape) for shape in ALL_SHAPES}
+SHAPE_ANCHORS = {shape: shape_anchors(shape) for shape in ALL_SHAPES}
+
+# Bitboards: cell (x, y) of the board lives in bit (y * BOARD_WIDTH + x).
+FULL_BOARD = (1 << (BOARD_WIDTH * BOARD_HEIGHT)) - 1
+ROW_MASKS = [((1 << BOARD_WIDTH) - 1) << (row * BOARD_WIDTH) for row in range(BOARD_HEIGHT)]
+COL_MASKS = [sum(1 << (row * BOARD_WIDTH + col) for row in range(BOARD_HEIGHT)) for col in range(BOARD_WIDTH)]
+# Bit offset of every block of a shape from its anchor
+SHAPE_SHIFTS = {shape: tuple(row * BOARD_WIDTH + col for row, col in SHAPE_CELLS[shape]) for shape in ALL_SHAPES}
+
+
+def build_shape_masks(shape):
+    """
+    Precompute the placement mask of a shape for every in-bounds (x, y) offset,
+    keeping the x-major order of SHAPE_ANCHORS.
+    """
+    base = sum(1 << shift for shift in SHAPE_SHIFTS[shape])
+    return {(x, y): base << (y * BOARD_WIDTH + x) for x, y in SHAPE_ANCHORS[shape]}
+
+
+SHAPE_MASKS = {shape: build_shape_masks(shape) for shape in ALL_SHAPES}
+
+
+def grid_to_bits(grid):
+    """
+    Return the occupancy of a grid as an integer whose bit (y * BOARD_WIDTH + x) is set
+    when cell (x, y) is filled. Grids that already carry a `bits` bitboard reuse it.
+    """
+    bits = getattr(grid, 'bits', None)
+    if bits is not None:
+        return bits
+    bits = 0
+    for y, row in enumerate(grid):
+        for x, cell in enumerate(row):
+            if cell:
+                bits |= 1 << (y * BOARD_WIDTH + x)
+    return bits
+
+
+def bits_to_grid(bits):
+    """Return the 0/1 list-of-lists grid of an occupancy bitboard."""
+    return [[(bits >> (y * BOARD_WIDTH + x)) & 1 for x in range(BOARD_WIDTH)] for y in range(BOARD_HEIGHT)]
+
+
+def capacity_kernel(shape):
+    """
+    Return the bit shift of every block of a shape and the mask of anchors that
+    shape_capacity considers: in-bounds offsets with x and y below 9.
+    """
+    anchors = sum(1 << (y * BOARD_WIDTH + x) for x, y in SHAPE_ANCHORS[shape]
+                  if x < BOARD_WIDTH - 1 and y < BOARD_HEIGHT - 1)
+    return SHAPE_SHIFTS[shape], anchors
+
+
+CAPACITY_KERNELS = [capacity_kernel(shape) for shape in ALL_SHAPES]
+
+
+def shape_capacity_bits(bits):
+    """
+    Count the (x, y, shape) placements of Board.shape_capacity on a bitboard. Shifting the
+    bitboard right by a block's offset lines that block up with its anchor, so ANDing the
+    shifted copies tests one shape at every anchor at once.
+    """
+    total = 0
+    for shifts, anchors in CAPACITY_KERNELS:
+        fits = anchors
+        for shift in shifts:
+            fits &= bits >> shift
+        total += fits.bit_count()
+    return total
+
+
+# Mask of all in-bounds anchors of every shape
+SHAPE_ANCHOR_BITS = {shape: sum(1 << (y * BOARD_WIDTH + x) for x, y in SHAPE_ANCHORS[shape]) for shape in ALL_SHAPES}
+
+
+def legal_placement_bits(bits, shape, anchors=None):
+    """
+    Return the mask of anchors at which the shape fits on an occupancy bitboard, limited to
+    `anchors` if given. Shifting the free cells right by a block's offset lines that block
+    up with its anchor, as in shape_capacity_bits.
+    """
+    shifts, fits = SHAPE_SHIFTS[shape], SHAPE_ANCHOR_BITS[shape]
+    if anchors is not None:
+        fits &= anchors
+    free = ~bits & FULL_BOARD
+    for shift in shifts:
+        fits &= free >> shift
+    return fits
+
+
+def affected_anchors(changed, shape):
+    """Return the anchors at which the shape covers at least one of the changed cells (a dilation of them)."""
+    affected = 0
+    for shift in SHAPE_SHIFTS[shape]:
+        affected |= changed >> shift
+    return affected & SHAPE_ANCHOR_BITS[shape]
+
+
+def line_counts(grid):
+    """Return the number of filled cells in every row and every column of a grid."""
+    row_counts = [sum(1 for cell in row if cell != 0) for row in grid]
+    col_counts = [sum(1 for row in grid if row[col] != 0) for col in range(BOARD_WIDTH)]
+    return row_counts, col_counts
+
+
+def clear_counted_lines(grid, row_counts, col_counts, rows, cols):
+    """
+    Clear whichever of the given rows and columns are complete, keeping the fill counts of
+    the grid up to date. Rows are cleared before columns are checked, as in
+    Board.clear_complete_lines, so a column only counts when no row was complete.
+    Returns (lines_cleared, cells_cleared).
+    """
+    full_rows = [row for row in rows if row_counts[row] == BOARD_WIDTH]
+    if full_rows:
+        for row in full_rows:
+            grid[row][:] = [0] * BOARD_WIDTH
+            row_counts[row] = 0
+            for col in range(BOARD_WIDTH):
+                col_counts[col] -= 1
+        return len(full_rows), len(full_rows) * BOARD_WIDTH
+
+    full_cols = [col for col in cols if col_counts[col] == BOARD_HEIGHT]
+    for col in full_cols:
+        for row in range(BOARD_HEIGHT):
+            grid[row][col] = 0
+            row_counts[row] -= 1
+        col_counts[col] = 0
+    return len(full_cols), len(full_cols) * BOARD_HEIGHT
+
+
 class Board:
 
     def __init__(self):
+        # Legal-placement mask per shape and the occupancy it was last brought up to date with
+        self.legal_masks = {}
+        self.legal_bits = 0
         # Initialize an empty board with all zeros
         self.grid = [[0 for _ in range(BOARD_WIDTH)] for _ in range(BOARD_HEIGHT)]
 
+    @property
+    def grid(self):
+        return self._grid
+
+    @grid.setter
+    def grid(self, grid):
+        # Per-row / per-column fill counts, kept up to date by place_shape and clear_complete_lines
+        self._grid = grid
+        self.row_counts, self.col_counts = line_counts(grid)
+        self.filled = sum(self.row_counts)
+        self.occupancy = grid_to_bits(grid)
+
     def draw(self, screen, color_key):
         """
         Draw the board on the given screen.
         """
+        import pygame  # only needed for rendering, so headless runs never import it
+
         for row in range(BOARD_HEIGHT):
             for col in range(BOARD_WIDTH):
                 # Adjust the x and y positions by BOARD_START_X and BOARD_START_Y
@@ -42,13 +207,35 @@ class Board:
                     color = color_key[self.grid[row][col]]
                     pygame.draw.rect(screen, color, rect)
 
-    def game_over(self, shapes):
+    def legal_placement_masks(self, shapes):
+        """
+        Return, for each shape, the mask of anchors (bit y * BOARD_WIDTH + x) at which it fits
+        on the board. Masks are cached per shape; when the occupancy has changed since the
+        last query, only the anchors whose placement covers a changed cell are recomputed.
+        """
+        bits = self.occupancy
+        changed = bits ^ self.legal_bits
+        if changed:
+            for shape, mask in self.legal_masks.items():
+                affected = affected_anchors(changed, shape)
+                if affected:
+                    self.legal_masks[shape] = (mask & ~affected) | legal_placement_bits(bits, shape, affected)
+            self.legal_bits = bits
+
+        masks = []
         for shape in shapes:
-            for x in range(BOARD_WIDTH):
-                for y in range(BOARD_HEIGHT):
-                    if self.can_place_shape(shape, x, y):
-                        return False
-        return True
+            mask = self.legal_masks.get(shape)
+            if mask is None:
+                mask = self.legal_masks[shape] = legal_placement_bits(bits, shape)
+            masks.append(mask)
+        return masks
+
+    def fitting_shapes(self, shapes):
+        """Return the shapes that can still be placed somewhere on the board."""
+        return [shape for shape, mask in zip(shapes, self.legal_placement_masks(shapes)) if mask]
+
+    def game_over(self, shapes):
+        return not any(self.legal_placement_masks(shapes))
 
     def place_shape(self, shape, x, y, color):
         """
@@ -67,36 +254,65 @@ class Board:
                         return False
         
         # Now place the shape
-        for row in range(len(shape)):
-            for col in range(len(shape[row])):
-                if shape[row][col] == 1:
-                    self.grid[row+y][col+x] = color
+        cells = SHAPE_CELLS[shape]
+        for row, col in cells:
+            self.grid[row+y][col+x] = color
+            self.row_counts[row+y] += 1
+            self.col_counts[col+x] += 1
+        self.filled += len(cells)
+        self.occupancy |= SHAPE_MASKS[shape][(x, y)]
 
-        self.clear_complete_lines()
+        # Only the rows and columns the shape touched can have been completed
+        touched_rows = {row + y for row, _ in cells}
+        touched_cols = {col + x for _, col in cells}
+        _, cells_cleared = clear_counted_lines(self.grid, self.row_counts, self.col_counts, touched_rows, touched_cols)
+        if cells_cleared:
+            self.filled -= cells_cleared
+            # A touched line is empty now only if it was just cleared
+            for row in touched_rows:
+                if not self.row_counts[row]:
+                    self.occupancy &= ~ROW_MASKS[row]
+            for col in touched_cols:
+                if not self.col_counts[col]:
+                    self.occupancy &= ~COL_MASKS[col]
         return True
     
     def simulate_place_shape(self, shape, x, y, color, grid=None):
         """
         Simulate placing a shape on the board at the given (x, y) position and return the hypothetical resultant board.
         """
-        # Use the hypothetical grid if provided, else create a copy of the board to simulate the placement
-        simulated_board = grid if grid else [row[:] for row in self.grid]
+        cells = SHAPE_CELLS[shape]
+
+        # Use the hypothetical grid if provided, else create a copy of the board to simulate the placement.
+        # The board itself never holds a complete line between moves, so only the lines the shape
+        # touches need checking there; a grid passed in may come from anywhere and is checked in full.
+        if grid:
+            simulated_board = grid
+            row_counts, col_counts = line_counts(grid)
+            check_rows, check_cols = range(BOARD_HEIGHT), range(BOARD_WIDTH)
+        else:
+            simulated_board = [row[:] for row in self.grid]
+            row_counts, col_counts = self.row_counts[:], self.col_counts[:]
+            check_rows = {row + y for row, _ in cells}
+            check_cols = {col + x for _, col in cells}
+
+        for row, col in cells:
+            # Check bounds
+            if row+y >= BOARD_HEIGHT or col+x >= BOARD_WIDTH or row+y < 0 or col+x < 0:
+                return None  # Return None if placement is out of bounds
+            # Check if space is not occupied
+            if simulated_board[row+y][col+x] != 0:
+                return None  # Return None if placement overlaps with existing shape
 
         # Simulate placing the shape
-        for row in range(len(shape)):
-            for col in range(len(shape[row])):
-                if shape[row][col] == 1:
-                    # Check bounds
-                    if row+y >= BOARD_HEIGHT or col+x >= BOARD_WIDTH:
-                        return None  # Return None if placement is out of bounds
-                    # Check if space is not occupied
-                    if simulated_board[row+y][col+x] != 0:
-                        return None  # Return None if placement overlaps with existing shape
-                    simulated_board[row+y][col+x] = color
-    
-        shape_size = sum(1 for row in shape for block in row if block)
-        lines_cleared = self.clear_complete_lines(simulated_board)
-        reward = (lines_cleared * 10 - shape_size) * 100 + self.get_density_reward_bonus(shape, x, y, color, simulated_board) * 10
+        for row, col in cells:
+            simulated_board[row+y][col+x] = color
+            row_counts[row+y] += 1
+            col_counts[col+x] += 1
+
+        lines_cleared, _ = clear_counted_lines(simulated_board, row_counts, col_counts, check_rows, check_cols)
+        density_reward = sum(row_counts[row + y] + col_counts[col + x] for row, col in cells)
+        reward = (lines_cleared * 10 - len(cells)) * 100 + density_reward * 10
 
         return (simulated_board, lines_cleared, reward)
     
@@ -104,23 +320,14 @@ class Board:
         """
         For each block of the grid which the shape will newly occupy, the density reward adds a bonus for each existing block in that block's row and column.
         """
-        board = grid if grid else [row[:] for row in self.grid]
-
-        density_reward = 0
-        for row in range(len(shape)):
-            for col in range(len(shape[row])):
-                if shape[row][col] == 1:
-                    density_reward += sum(1 for block in board[row + y] if block != 0)
-                    density_reward += sum(1 for row in board if row[col + x] != 0)
-        return density_reward
-    
-
+        row_counts, col_counts = line_counts(grid) if grid else (self.row_counts, self.col_counts)
+        return sum(row_counts[row + y] + col_counts[col + x] for row, col in SHAPE_CELLS[shape])
 
     def can_place_shape(self, shape, x, y, grid=None):
         """
         Check if a shape can be placed at the given (x, y) position without overlap or out of bounds.
         """
-        grid = grid if grid else [row[:] for row in self.grid]
+        grid = grid if grid else self.grid
 
         for row in range(len(shape)):
             for col in range(len(shape[row])):
@@ -133,14 +340,32 @@ class Board:
                         return False
         return True
 
+    def legal_positions(self, shape, grid=None):
+        """
+        Return every (x, y) position at which the shape can be placed.
+        """
+        if not grid or grid is self.grid:
+            mask = self.legal_placement_masks((shape,))[0]
+            return [(x, y) for x, y in SHAPE_ANCHORS[shape] if mask >> (y * BOARD_WIDTH + x) & 1]
+        cells = SHAPE_CELLS[shape]
+        return [(x, y) for x, y in SHAPE_ANCHORS[shape]
+                if not any(grid[row + y][col + x] for row, col in cells)]
     
     def clear_complete_lines(self, grid=None):
         """
         Clear any complete rows or columns.
         Returns the number of lines cleared.
         """
+        if not grid or grid is self.grid:
+            lines_cleared, cells_cleared = clear_counted_lines(self.grid, self.row_counts, self.col_counts,
+                                                               range(BOARD_HEIGHT), range(BOARD_WIDTH))
+            if cells_cleared:
+                self.filled -= cells_cleared
+                self.occupancy = grid_to_bits(self.grid)
+            return lines_cleared
+
         lines_cleared = 0
-        grid_to_clear = grid if grid else self.grid
+        grid_to_clear = grid
         # Check rows
         for row in range(BOARD_HEIGHT):
             if all(grid_to_clear[row][col] != 0 for col in range(BOARD_WIDTH)):
@@ -163,30 +388,20 @@ class Board:
         self.grid = [[0 for _ in range(BOARD_WIDTH)] for _ in range(BOARD_HEIGHT)]
 
     def shape_capacity(self, grid):
-        for row in range(BOARD_HEIGHT):
-            for col in range(BOARD_WIDTH):
-                if grid[row][col] == 0:
-                    grid[row][col] = 1
-                else:
-                    grid[row][col] = 0
-
-        valid_positions = []
-        for x in range(BOARD_WIDTH - 1):
-            for y in range(BOARD_HEIGHT - 1):
-                shapes_sample = ALL_SHAPES
-                for shape in shapes_sample:
-                    if not self.can_place_shape(shape, x, y, grid):
-                        continue
-                    else:
-                        valid_positions.append((x, y))
-
-        return len(valid_positions)
+        """
+        Count the (x, y, shape) placements with x, y < 9 that fit on the grid once it is
+        inverted, i.e. that cover only filled cells. The grid itself is left untouched.
+        """
+        return shape_capacity_bits(grid_to_bits(grid))
     
-    def heuristic_score(self, grid, lines_cleared):
-        shape_capacity_score = self.shape_capacity(grid)
+    def heuristic_score(self, grid, lines_cleared, bits=None):
+        """Score an afterstate grid; bits, its occupancy when already known, spares the grid scan."""
+        shape_capacity_score = self.shape_capacity(grid) if bits is None else shape_capacity_bits(bits)
         return shape_capacity_score + 100 * 300
     
     def empty_cells(self, grid):
+        if grid is self.grid:
+            return BOARD_WIDTH * BOARD_HEIGHT - self.filled
         count = 0
         for row in range(BOARD_HEIGHT):
             for col in range(BOARD_WIDTH):
@@ -194,12 +409,28 @@ class Board:
                     count += 1
         return count
     
-    def init_model(self, model_path="game_cnn_model.pth"):
-        self.model = load_model(model_path)
-        self.model.eval()
+    def init_model(self, model_path="game_cnn_model.pth", allow_int8=False):
+        """
+        Load the value network. A .npz of weights exported with `export.py --numpy` runs on
+        the NumPy forward pass without importing torch; anything else is a torch checkpoint,
+        replaced by its int8 export only with allow_int8 (see model.get_model).
+        """
+        if model_path.endswith('.npz'):
+            from numpy_model import get_numpy_model
+            self.model = get_numpy_model(model_path)
+            self.model_backend = 'numpy'
+            return
+
+        global torch, denormalize
+        import torch
+        from model import get_model, denormalize
+        self.model = get_model(model_path, allow_int8)
+        self.model_backend = 'torch'
     
     def utility_approximation_cnn(self, grid=None):
         board = grid if grid else self.grid
+        if self.model_backend == 'numpy':
+            return self.model.utilities([board])[0]
         grid_state = [[1 if cell > 0 else 0 for cell in row] for row in board]
 
         # Convert the preprocessed board state to a PyTorch tensor with an added channel dimension
@@ -207,6 +438,23 @@ class Board:
         
         # Use the model to estimate utility
         with torch.no_grad():
-            estimated_utility = self.model(board_state_tensor).item()
+            estimated_utility = denormalize(self.model, self.model(board_state_tensor)).item()
         
         return estimated_utility
+
+    def utility_approximation_batch(self, grids):
+        """
+        Estimate the utility of many grids at once, stacking them into a single
+        (N, 1, 10, 10) tensor so the model runs one forward pass. Utilities are in remaining
+        score units: the model's normalized outputs are mapped back with model.denormalize.
+        """
+        if not grids:
+            return []
+        if self.model_backend == 'numpy':
+            return self.model.utilities(grids)
+        board_states_tensor = (torch.tensor(grids) > 0).to(torch.float32).unsqueeze(1)
+
+        with torch.inference_mode():
+            estimated_utilities = denormalize(self.model, self.model(board_states_tensor)).squeeze(1)
+
+        return estimated_utilities.tolist()
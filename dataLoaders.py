@@ -1,36 +1,66 @@
 # dataLoaders.py
 
+import argparse
 import json
+import os
 import torch
-from torch.utils.data import Dataset, DataLoader
+from torch.utils.data import Dataset, IterableDataset, DataLoader, Sampler, get_worker_info
 from sklearn.model_selection import train_test_split
 import numpy as np
 
+# Packed format: <prefix>.boards holds one 13-byte np.packbits row per 10x10 board and
+# <prefix>.targets the matching float32 remaining scores.
+BOARD_CELLS = 100
+PACKED_BOARD_BYTES = 13
+
 class GameDataset(Dataset):
-    def __init__(self, data):
-        self.data = data
+    def __init__(self, data, score_mean=None, score_std=None):
+        # Convert the whole split to tensors once, so a batch is a plain slice of them
+        self.board_states = torch.tensor([item['board_state'] for item in data], dtype=torch.float32).unsqueeze(1)
+        remaining_scores = np.array([item['remaining_score'] for item in data], dtype=np.float64)
 
-        # Calculate mean and standard deviation for remaining score
-        remaining_scores = np.array([item['remaining_score'] for item in data])
-        self.score_mean = remaining_scores.mean()
-        self.score_std = remaining_scores.std()
+        # Normalize with the statistics of the whole dataset when they are given
+        if score_mean is None:
+            score_mean, score_std = target_stats(remaining_scores)
+        self.score_mean = score_mean
+        self.score_std = score_std
+        normalized_remaining_scores = (remaining_scores - score_mean) / score_std
+        self.remaining_scores = torch.from_numpy(normalized_remaining_scores.astype(np.float32)).unsqueeze(1)
 
     def __len__(self):
-        return len(self.data)
+        return len(self.board_states)
 
     def __getitem__(self, idx):
-        data_item = self.data[idx]
-        
+        return self.board_states[idx], self.remaining_scores[idx]
+
+
+class RangeBatchSampler(Sampler):
+    """
+    Yields whole batches for a DataLoader with batch_size=None, so the dataset gets each
+    batch as one index and returns it as one tensor gather instead of collating single
+    items. In order the batches are slice(start, stop); with shuffle they are index tensors
+    cut from a new permutation every epoch, so the batches themselves change between epochs.
+    """
 
-        board_state = torch.tensor(data_item['board_state'], dtype=torch.float32).unsqueeze(0)
+    def __init__(self, length, batch_size, shuffle=False, seed=0):
+        self.length = length
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.seed = seed
+        self.epoch = 0
 
-        remaining_score = np.array(data_item['remaining_score'], dtype=np.float32)
-        normalized_remaining_score = (remaining_score - self.score_mean) / self.score_std
-        remaining_score_tensor = torch.tensor([normalized_remaining_score], dtype=torch.float32)
-        
-        # remaining_score_tensor = torch.tensor([data_item['remaining_score']], dtype=torch.float32)
-        
-        return board_state, remaining_score_tensor
+    def __len__(self):
+        return (self.length + self.batch_size - 1) // self.batch_size
+
+    def __iter__(self):
+        if not self.shuffle:
+            for start in range(0, self.length, self.batch_size):
+                yield slice(start, min(start + self.batch_size, self.length))
+            return
+        generator = torch.Generator().manual_seed(self.seed + self.epoch)
+        order = torch.randperm(self.length, generator=generator)
+        self.epoch += 1
+        yield from order.split(self.batch_size)
 
 def read_jsonl_file(path):
     data = []
@@ -43,16 +73,223 @@ def read_jsonl_file(path):
                 continue
     return data
 
-def get_data_loaders(path, batch_size=564, test_size=0.2):
+def loader_options(num_workers=0, prefetch_factor=None, pin_memory=False):
+    """
+    Keyword arguments for the training DataLoaders. Worker processes are kept alive between
+    epochs, and prefetch_factor (batches queued per worker) only applies when there are workers.
+    """
+    options = {'num_workers': num_workers, 'pin_memory': pin_memory}
+    if num_workers > 0:
+        options['persistent_workers'] = True
+        if prefetch_factor is not None:
+            options['prefetch_factor'] = prefetch_factor
+    return options
+
+
+def get_data_loaders(path, batch_size=564, test_size=0.2, num_workers=0, prefetch_factor=None, pin_memory=False):
+    options = loader_options(num_workers, prefetch_factor, pin_memory)
+    if not path.endswith('.jsonl'):
+        return get_packed_data_loaders(path, batch_size=batch_size, test_size=test_size, **options)
+
     game_data = read_jsonl_file(path)
+    score_mean, score_std = target_stats(np.array([item['remaining_score'] for item in game_data], dtype=np.float64))
 
     train_data, val_data = train_test_split(game_data, test_size=test_size)
 
-    train_dataset = GameDataset(train_data)
-    val_dataset = GameDataset(val_data)
+    train_dataset = GameDataset(train_data, score_mean, score_std)
+    val_dataset = GameDataset(val_data, score_mean, score_std)
+
+    train_loader = DataLoader(train_dataset, batch_size=None,
+                              sampler=RangeBatchSampler(len(train_dataset), batch_size, shuffle=True), **options)
+    val_loader = DataLoader(val_dataset, batch_size=None,
+                            sampler=RangeBatchSampler(len(val_dataset), batch_size), **options)
+
+    return train_loader, val_loader
+
+
+def packed_paths(prefix):
+    return prefix + '.boards', prefix + '.targets'
+
+
+def packed_length(prefix):
+    return os.path.getsize(packed_paths(prefix)[1]) // 4
+
+
+def open_packed(prefix):
+    """Memory-map the boards and targets of a packed dataset."""
+    boards_path, targets_path = packed_paths(prefix)
+    length = packed_length(prefix)
+    boards = np.memmap(boards_path, dtype=np.uint8, mode='r', shape=(length, PACKED_BOARD_BYTES))
+    targets = np.memmap(targets_path, dtype=np.float32, mode='r', shape=(length,))
+    return boards, targets
+
+
+def convert_jsonl_to_packed(paths, prefix, chunk_size=65536):
+    """
+    Convert one or more JSONL game logs into the packed format in a single streaming pass.
+    Returns the number of samples written.
+    """
+    boards_path, targets_path = packed_paths(prefix)
+    written = 0
+    with open(boards_path, 'wb') as boards_file, open(targets_path, 'wb') as targets_file:
+        def flush(boards, targets):
+            cells = np.array(boards, dtype=bool).reshape(len(boards), BOARD_CELLS)
+            boards_file.write(np.packbits(cells, axis=1).tobytes())
+            targets_file.write(np.array(targets, dtype=np.float32).tobytes())
+
+        boards, targets = [], []
+        for path in paths:
+            with open(path, 'r') as file:
+                for line in file:
+                    try:
+                        item = json.loads(line)
+                    except json.JSONDecodeError as e:
+                        print(f"Error decoding line: {e}")
+                        continue
+                    boards.append(item['board_state'])
+                    targets.append(item['remaining_score'])
+                    if len(boards) == chunk_size:
+                        flush(boards, targets)
+                        written += len(boards)
+                        boards, targets = [], []
+        if boards:
+            flush(boards, targets)
+            written += len(boards)
+    return written
+
+
+def unpack_boards(packed):
+    """Turn a (B, 13) array of packed boards into a (B, 1, 10, 10) float32 tensor."""
+    cells = np.unpackbits(packed, axis=1, count=BOARD_CELLS)
+    return torch.from_numpy(cells.reshape(-1, 1, 10, 10)).to(torch.float32)
+
 
-    train_loader = DataLoader(train_dataset, batch_size=batch_size, shuffle=True)
-    val_loader = DataLoader(val_dataset, batch_size=batch_size, shuffle=False)
+def target_stats(targets, chunk_size=1 << 20):
+    """Mean and standard deviation of the targets, accumulated chunk by chunk in float64."""
+    total = 0.0
+    total_squares = 0.0
+    for start in range(0, len(targets), chunk_size):
+        chunk = np.asarray(targets[start:start + chunk_size], dtype=np.float64)
+        total += chunk.sum()
+        total_squares += np.square(chunk).sum()
+    mean = total / len(targets)
+    return mean, np.sqrt(max(total_squares / len(targets) - mean * mean, 0.0))
+
+
+class PackedGameDataset(Dataset):
+    """
+    Map-style dataset over a packed file, optionally restricted to `indices`. Indexing it
+    with a slice, list or array returns a whole batch (boards, normalized scores) from one
+    vectorized read. Scores are normalized with the given statistics, or with those of
+    the whole file.
+    """
+
+    def __init__(self, prefix, indices=None, score_mean=None, score_std=None):
+        self.prefix = prefix
+        self.boards, self.targets = open_packed(prefix)
+        self.indices = np.arange(len(self.targets)) if indices is None else np.asarray(indices)
+
+        if score_mean is None:
+            score_mean, score_std = target_stats(self.targets)
+        self.score_mean = score_mean
+        self.score_std = score_std
+
+    def __getstate__(self):
+        # Pickling a memory map copies the whole file, so DataLoader workers reopen it instead
+        state = self.__dict__.copy()
+        state['boards'] = state['targets'] = None
+        return state
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, idx):
+        if np.isscalar(idx):
+            board_state, remaining_score = self[[idx]]
+            return board_state[0], remaining_score[0]
+
+        if self.boards is None:
+            self.boards, self.targets = open_packed(self.prefix)
+        # Sorted positions keep the reads from the memory map sequential
+        positions = np.sort(self.indices[idx if isinstance(idx, slice) else np.asarray(idx)])
+        board_state = unpack_boards(self.boards[positions])
+        remaining_score = (self.targets[positions] - self.score_mean) / self.score_std
+        return board_state, torch.from_numpy(remaining_score.astype(np.float32)).unsqueeze(1)
+
+
+class PackedGameStream(IterableDataset):
+    """
+    Streams batches from a packed file that may be larger than memory. The file is read in
+    contiguous chunks of chunk_batches batches; with shuffle the chunk order and the rows
+    within a chunk are permuted, differently for every set_epoch. Each DataLoader worker
+    reads its own subset of chunks.
+    """
+
+    def __init__(self, prefix, batch_size=512, shuffle=True, chunk_batches=64, seed=0, score_mean=None,
+                 score_std=None):
+        self.prefix = prefix
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.chunk_size = batch_size * chunk_batches
+        self.seed = seed
+        self.epoch = 0
+        boards, targets = open_packed(prefix)
+        self.length = len(targets)
+        if score_mean is None:
+            score_mean, score_std = target_stats(targets)
+        self.score_mean = score_mean
+        self.score_std = score_std
+
+    def __len__(self):
+        return (self.length + self.batch_size - 1) // self.batch_size
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def __iter__(self):
+        boards, targets = open_packed(self.prefix)
+        worker = get_worker_info()
+        worker_id, num_workers = (worker.id, worker.num_workers) if worker else (0, 1)
+        rng = np.random.default_rng((self.seed, self.epoch))
+
+        chunks = np.arange(0, self.length, self.chunk_size)
+        if self.shuffle:
+            rng.shuffle(chunks)
+        for start in chunks[worker_id::num_workers]:
+            chunk_boards = np.asarray(boards[start:start + self.chunk_size])
+            chunk_targets = (np.asarray(targets[start:start + self.chunk_size]) - self.score_mean) / self.score_std
+            order = rng.permutation(len(chunk_targets)) if self.shuffle else np.arange(len(chunk_targets))
+            for batch_start in range(0, len(order), self.batch_size):
+                rows = order[batch_start:batch_start + self.batch_size]
+                yield (unpack_boards(chunk_boards[rows]),
+                       torch.from_numpy(chunk_targets[rows].astype(np.float32)).unsqueeze(1))
+
+
+def get_packed_data_loaders(prefix, batch_size=564, test_size=0.2, seed=0, **options):
+    """
+    Train/validation loaders over a packed dataset, split by a seeded random permutation.
+    Both splits are normalized with the statistics of the whole file. Extra keyword
+    arguments (see loader_options) are passed on to the DataLoaders.
+    """
+    score_mean, score_std = target_stats(open_packed(prefix)[1])
+    permutation = np.random.default_rng(seed).permutation(packed_length(prefix))
+    val_count = int(len(permutation) * test_size)
+
+    train_dataset = PackedGameDataset(prefix, permutation[val_count:], score_mean, score_std)
+    val_dataset = PackedGameDataset(prefix, permutation[:val_count], score_mean, score_std)
+
+    train_loader = DataLoader(train_dataset, batch_size=None,
+                              sampler=RangeBatchSampler(len(train_dataset), batch_size, shuffle=True), **options)
+    val_loader = DataLoader(val_dataset, batch_size=None,
+                            sampler=RangeBatchSampler(len(val_dataset), batch_size), **options)
 
     return train_loader, val_loader
 
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert JSONL game logs to the packed training format.")
+    parser.add_argument('inputs', nargs='+', help="JSONL files, e.g. self-play shards")
+    parser.add_argument('--output', required=True, help="output prefix for the .boards/.targets files")
+    args = parser.parse_args()
+    count = convert_jsonl_to_packed(args.inputs, args.output)
+    print(f"Wrote {count} samples to {args.output}.boards / {args.output}.targets")
@@ -0,0 +1,129 @@
+# export.py
+
+import argparse
+import os
+import numpy as np
+import torch
+import torch.nn as nn
+from torch.nn.utils.fusion import fuse_conv_bn_eval
+from model import FoldedGameCNN, load_model, artifact_paths, time_model
+from numpy_model import NumpyGameCNN
+
+
+def fold_model(model):
+    """Return a FoldedGameCNN with the BatchNorm layers of an eval-mode GameCNN folded into its convolutions."""
+    model.eval()
+    folded = FoldedGameCNN()
+    folded.conv1 = fuse_conv_bn_eval(model.conv1, model.bn1)
+    folded.conv2 = fuse_conv_bn_eval(model.conv2, model.bn2)
+    folded.fc1.load_state_dict(model.fc1.state_dict())
+    folded.fc2.load_state_dict(model.fc2.state_dict())
+    return folded.eval()
+
+
+def trace_model(model):
+    """Trace a model on a single board and freeze it for inference."""
+    with torch.no_grad():
+        traced = torch.jit.trace(model, torch.zeros(1, 1, 10, 10))
+    return torch.jit.freeze(traced)
+
+
+def quantize_model(folded):
+    """Dynamically quantize the fully connected layers to int8; the convolutions stay float."""
+    return torch.ao.quantization.quantize_dynamic(folded, {nn.Linear}, dtype=torch.qint8)
+
+
+def check_boards(count=1024, seed=0):
+    """Random binary boards of varied density, plus the empty board, for comparing outputs."""
+    generator = torch.Generator().manual_seed(seed)
+    density = torch.rand(count, 1, 1, 1, generator=generator)
+    boards = (torch.rand(count, 1, 10, 10, generator=generator) < density).to(torch.float32)
+    boards[0] = 0
+    return boards
+
+
+def max_difference(reference, model, boards):
+    """Largest absolute difference between the outputs of two models, over batched and single-board calls."""
+    with torch.inference_mode():
+        expected = reference(boards)
+        difference = (model(boards) - expected).abs().max().item()
+        for board, value in zip(boards[:16], expected[:16]):
+            difference = max(difference, (model(board.unsqueeze(0))[0] - value).abs().max().item())
+    return difference
+
+
+def save_numpy_weights(folded, score_mean, score_std, npz_path):
+    """Write the weights of a FoldedGameCNN for numpy_model.NumpyGameCNN."""
+    weights = {name.replace('.', '_'): tensor.detach().numpy() for name, tensor in folded.state_dict().items()}
+    np.savez(npz_path, score_mean=score_mean, score_std=score_std, **weights)
+
+
+class NumpyModule:
+    """Lets a NumpyGameCNN be compared like a torch model in max_difference."""
+
+    def __init__(self, model):
+        self.model = model
+
+    def __call__(self, boards):
+        return torch.from_numpy(self.model(boards.numpy()))
+
+
+def export(model_path, quantize=False, tolerance=1e-4, int8_tolerance=0.05, numpy_weights=False):
+    """
+    Write the folded and traced model (with quantize also the int8 variant, with
+    numpy_weights also the weights for the NumPy forward pass) next to the checkpoint, see
+    model.artifact_paths. An artifact is only kept when its outputs match the eager model
+    within the tolerance; int8_tolerance is relative to the spread of the eager outputs.
+    Returns {artifact: (max difference, written)}.
+    """
+    model = load_model(model_path)
+    model.eval()
+    boards = check_boards()
+    with torch.inference_mode():
+        output_spread = model(boards).std().item()
+    paths = artifact_paths(model_path)
+
+    folded = fold_model(model)
+    candidates = {'scripted': (trace_model(folded), tolerance)}
+    if quantize:
+        candidates['int8'] = (trace_model(quantize_model(folded)), int8_tolerance * output_spread)
+
+    results = {}
+    for name, (artifact, limit) in candidates.items():
+        difference = max_difference(model, artifact, boards)
+        written = difference <= limit
+        if written:
+            torch.jit.save(artifact, paths[name])
+        results[name] = (difference, written)
+
+    if numpy_weights:
+        save_numpy_weights(folded, model.score_mean, model.score_std, paths['numpy'])
+        difference = max_difference(model, NumpyModule(NumpyGameCNN(paths['numpy'])), boards)
+        written = difference <= tolerance
+        if not written:
+            os.remove(paths['numpy'])
+        results['numpy'] = (difference, written)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export a GameCNN checkpoint for fast inference.")
+    parser.add_argument('model_path', nargs='?', default='game_cnn_model.pth')
+    parser.add_argument('--quantize', action='store_true', help="also export a dynamically quantized int8 variant")
+    parser.add_argument('--numpy', action='store_true', help="also export weights for the torch-free NumPy model")
+    parser.add_argument('--tolerance', type=float, default=1e-4, help="max absolute difference to the eager model")
+    parser.add_argument('--int8-tolerance', type=float, default=0.05,
+                        help="max difference of the int8 variant, relative to the spread of the outputs")
+    args = parser.parse_args()
+
+    results = export(args.model_path, args.quantize, args.tolerance, args.int8_tolerance, args.numpy)
+    eager = load_model(args.model_path)
+    eager.eval()
+    print(f"eager: {time_model(eager) * 1000:.1f} ms")
+    paths = artifact_paths(args.model_path)
+    for name, (difference, written) in results.items():
+        if written:
+            artifact = NumpyModule(NumpyGameCNN(paths[name])) if name == 'numpy' else torch.jit.load(paths[name])
+            print(f"{name}: max difference {difference:.2e}, {time_model(artifact) * 1000:.1f} ms -> {paths[name]}")
+        else:
+            print(f"{name}: max difference {difference:.2e} exceeds the tolerance, not written")
@@ -1,15 +1,37 @@
 import random
 import itertools
-import copy  # Import copy module for deep copy
-from board import BOARD_HEIGHT, BOARD_WIDTH
+import math
+from collections import Counter
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, wait
+from gamestate import GameState
+from board import grid_to_bits, bits_to_grid, shape_capacity_bits
+from bitboard import SHAPE_SIZES, simulate_bits
+from transposition import TranspositionTable
+from mcts import NodeStore, CHANCE, UNEXPANDED
+
+# Value ExpectimaxAgent and MCTSAgent give a position where the shape to place does not fit
+LOSS_VALUE = -100000
 
 class GameAPI:
-    def __init__(self, board, shapes, shape_colors):
+    def __init__(self, board, shapes, shape_colors, cache=None, seed=None):
+        """
+        With a seed the shapes are dealt from this game's own random.Random, otherwise from
+        the module-level generator. set_sequence() deals a pre-generated sequence instead.
+        """
         self.board = board
+        self.cache = cache  # optional TranspositionTable for legal positions
         self.score = 0
         self.shapes = shapes
         self.shape_colors = shape_colors
-        self.next_shapes = [random.choice(self.shapes) for _ in range(3)]
+        self.rng = random.Random(seed) if seed is not None else random
+        self.sequence = None  # shape indices dealt in order, see set_sequence
+        self.dealt = 0
+        self.recording = None  # list collecting every (shape, position) placed, when set
+        self.next_shapes = [self.rng.choice(self.shapes) for _ in range(3)]
+        # Moves generated and evaluations avoided by deduplication
+        self.stats = {'moves': 0, 'duplicate_moves_skipped': 0, 'duplicate_evaluations_skipped': 0}
 
     def view_next_pieces(self):
         """Return a list of the next shapes to b``e played."""
@@ -17,13 +39,23 @@ class GameAPI:
 
     def get_valid_positions(self, shape, grid=None):
         """Get all valid positions for the given shape."""
-        grid = grid if grid else self.board.grid
-        valid_positions = []
-        for x in range(BOARD_WIDTH):
-            for y in range(BOARD_HEIGHT):
-                if self.board.can_place_shape(shape, x, y, grid=grid):
-                    valid_positions.append((x, y))
-        return valid_positions
+        if self.cache is None:
+            return self.board.legal_positions(shape, grid=grid)
+        bits = grid_to_bits(grid) if grid else self.board.occupancy
+        return self.cache.legal_positions(bits, shape, lambda: self.board.legal_positions(shape, grid=grid))
+
+    def get_legal_moves(self, shapes, grid=None):
+        """
+        Get every valid (shape, x, y) move for a hand of shapes in one pass. A shape held more
+        than once is listed once, since its copies would only repeat the same moves.
+        """
+        moves = []
+        for shape, count in Counter(shapes).items():
+            positions = self.get_valid_positions(shape, grid=grid)
+            moves.extend((shape, x, y) for x, y in positions)
+            self.stats['duplicate_moves_skipped'] += (count - 1) * len(positions)
+        self.stats['moves'] += len(moves)
+        return moves
 
     def place_piece(self, shape, position):
         """Attempt to place a piece at the specified position."""
@@ -31,13 +63,15 @@ class GameAPI:
             color = self.shape_colors[shape]
             self.board.place_shape(shape, position[0], position[1], color)
             self.score += sum(1 for row in shape for block in row if block)
+            if self.recording is not None:
+                self.recording.append((shape, position))
             return True
         return False
     
     def simulate_placement(self, shape, position, grid=None):
         """ Returns the hypothetical grid and score if a placement was made"""
         if grid is None:
-            grid = [row[:] for row in self.board.grid]
+            grid = self.board.grid
         if self.board.can_place_shape(shape, position[0], position[1], grid=grid):
             color = self.shape_colors[shape]
             hypothetical_result = self.board.simulate_place_shape(shape, position[0], position[1], color)
@@ -47,6 +81,18 @@ class GameAPI:
             return (reward, result_grid, lines_cleared)
         return None
 
+    def get_afterstates(self, shapes):
+        """
+        Simulate every valid move for a hand of shapes.
+        Returns a list of (shape, position, reward, result_grid, lines_cleared).
+        """
+        afterstates = []
+        for shape, x, y in self.get_legal_moves(shapes):
+            simulation = self.simulate_placement(shape, (x, y))
+            if simulation:
+                afterstates.append((shape, (x, y)) + simulation)
+        return afterstates
+
     def clear_lines(self):
         """Clear complete lines on the board."""
         return self.board.clear_complete_lines()
@@ -55,22 +101,63 @@ class GameAPI:
         """Get the current score."""
         return self.score
     
-    def reset_game(self):
+    def reset_game(self, seed=None):
+        """Clear the board and score; a seed starts a fresh random.Random for the new game's shapes."""
         self.score = 0
         self.board.clear_board()
+        if seed is not None:
+            self.rng = random.Random(seed)
         return True
 
+    def set_sequence(self, sequence):
+        """
+        Deal the shapes self.shapes[i] for the indices i of a pre-generated sequence (e.g.
+        from replay.generate_sequence), starting at its beginning; None goes back to the RNG.
+        """
+        self.sequence = sequence
+        self.dealt = 0
+
     def is_game_over(self):
         """Check if the game is over."""
         return self.board.game_over(self.next_shapes)
 
     def get_new_shapes(self, count):
-        """Get a new set of random shapes."""
-        return [random.choice(self.shapes) for _ in range(count)]
+        """Get a new set of random shapes, or the next ones of the piece sequence."""
+        if self.sequence is None:
+            return [self.rng.choice(self.shapes) for _ in range(count)]
+        if self.dealt + count > len(self.sequence):
+            raise IndexError(f"piece sequence exhausted after {self.dealt} shapes")
+        indices = self.sequence[self.dealt:self.dealt + count]
+        self.dealt += count
+        return [self.shapes[i] for i in indices]
+
+def afterstate_bits(board, grid, shape, position):
+    """
+    Occupancy of the grid left by placing shape at position on the board. BitBoard grids
+    carry it; otherwise the move is replayed on the board's occupancy, which is much
+    cheaper than scanning the 100 cells of the grid.
+    """
+    bits = getattr(grid, 'bits', None)
+    if bits is None:
+        bits = simulate_bits(board.occupancy, shape, *position)[0]
+    return bits
+
+
+def cached_heuristic_score(board, cache, grid, lines_cleared, bits=None):
+    """
+    Board.heuristic_score of an afterstate, looked up by occupancy when a cache is given;
+    bits is the afterstate's occupancy when the caller already has it (see afterstate_bits).
+    """
+    if cache is None:
+        return board.heuristic_score(grid, lines_cleared)
+    if bits is None:
+        bits = grid_to_bits(grid)
+    return cache.value(bits, lambda: board.heuristic_score(grid, lines_cleared, bits))
 
 class RandomAgent:
-    def __init__(self, api):
+    def __init__(self, api, seed=None):
         self.api = api
+        self.rng = random.Random(seed) if seed is not None else random
         self.next_shapes = self.api.get_new_shapes(3)  # Initialize with three random shapes
 
     def play_turn(self):
@@ -78,11 +165,11 @@ class RandomAgent:
         if not self.next_shapes:  # If no shapes are left, get a new set of three shapes
             self.next_shapes = self.api.get_new_shapes(3)
         
-        shape = random.choice(self.next_shapes)
+        shape = self.rng.choice(self.next_shapes)
         valid_positions = self.api.get_valid_positions(shape)
         
         if valid_positions:
-            position = random.choice(valid_positions)
+            position = self.rng.choice(valid_positions)
             self.api.place_piece(shape, position)
             self.next_shapes.remove(shape)
 
@@ -93,11 +180,15 @@ class RandomAgent:
 
 
 class GreedyHeuristicAgent:
-    def __init__(self, api):
+    def __init__(self, api, cache=None):
         self.api = api
         self.board = api.board
+        self.cache = cache  # optional TranspositionTable for heuristic scores
         self.next_shapes = self.api.get_new_shapes(3)  # Initialize with three random shapes
 
+    def heuristic_score(self, grid, lines_cleared, bits=None):
+        return cached_heuristic_score(self.board, self.cache, grid, lines_cleared, bits)
+
     def play_turn(self):
         """Play a single turn using a random move."""
         if not self.next_shapes:  # If no shapes are left, get a new set of three shapes
@@ -106,19 +197,19 @@ class GreedyHeuristicAgent:
         best_shape = None
         best_position = None
         max_score = float('-inf')
-        for shape in self.next_shapes:
-            valid_positions = self.api.get_valid_positions(shape)
-            for position in valid_positions:
-                simulation = self.api.simulate_placement(shape, position)
-                reward = simulation[0]
-                hypothetical_board = simulation[1]
-                lines_cleared = simulation[2]
-                if hypothetical_board:
-                    score = self.board.heuristic_score(hypothetical_board, lines_cleared)
-                    if score > max_score:
-                        max_score = score
-                        best_shape = shape
-                        best_position = position
+        for shape, x, y in self.api.get_legal_moves(self.next_shapes):
+            position = (x, y)
+            simulation = self.api.simulate_placement(shape, position)
+            reward = simulation[0]
+            hypothetical_board = simulation[1]
+            lines_cleared = simulation[2]
+            if hypothetical_board:
+                bits = afterstate_bits(self.board, hypothetical_board, shape, position) if self.cache else None
+                score = self.heuristic_score(hypothetical_board, lines_cleared, bits)
+                if score > max_score:
+                    max_score = score
+                    best_shape = shape
+                    best_position = position
         if best_shape and best_position:
             self.api.place_piece(best_shape, best_position)
             self.next_shapes.remove(best_shape)
@@ -127,11 +218,15 @@ class GreedyHeuristicAgent:
         return True
     
 class BellmanAgent:
-    def __init__(self, api):
+    def __init__(self, api, cache=None):
         self.api = api
         self.board = api.board
+        self.cache = cache  # optional TranspositionTable for heuristic scores
         self.next_shapes = self.api.get_new_shapes(3)  # Initialize with three random shapes
 
+    def heuristic_score(self, grid, lines_cleared, bits=None):
+        return cached_heuristic_score(self.board, self.cache, grid, lines_cleared, bits)
+
     def play_turn(self):
         """Play a single turn using a random move."""
         if not self.next_shapes:  # If no shapes are left, get a new set of three shapes
@@ -140,20 +235,20 @@ class BellmanAgent:
         best_shape = None
         best_position = None
         max_score = float('-inf')
-        for shape in self.next_shapes:
-            valid_positions = self.api.get_valid_positions(shape)
-            for position in valid_positions:
-                simulation = self.api.simulate_placement(shape, position)
-                reward = simulation[0]
-                hypothetical_board = simulation[1]
-                lines_cleared = simulation[2]
-                if hypothetical_board:
-                    score = reward
-                    score += self.board.heuristic_score(hypothetical_board, lines_cleared)
-                    if score > max_score:
-                        max_score = score
-                        best_shape = shape
-                        best_position = position
+        for shape, x, y in self.api.get_legal_moves(self.next_shapes):
+            position = (x, y)
+            simulation = self.api.simulate_placement(shape, position)
+            reward = simulation[0]
+            hypothetical_board = simulation[1]
+            lines_cleared = simulation[2]
+            if hypothetical_board:
+                bits = afterstate_bits(self.board, hypothetical_board, shape, position) if self.cache else None
+                score = reward
+                score += self.heuristic_score(hypothetical_board, lines_cleared, bits)
+                if score > max_score:
+                    max_score = score
+                    best_shape = shape
+                    best_position = position
         if best_shape and best_position:
             self.api.place_piece(best_shape, best_position)
             self.next_shapes.remove(best_shape)
@@ -163,12 +258,69 @@ class BellmanAgent:
 
 
 
+def greedy_reward_move(state):
+    """Return the move of the hand with the highest immediate reward, or None if none fits."""
+    best_move = None
+    max_score = float('-inf')
+    for move in state.legal_moves():
+        _, reward = state.place(*move)
+        if reward > max_score:
+            max_score = reward
+            best_move = move
+    return best_move
+
+
+def rollout(state, depth, deal):
+    """Play up to `depth` greedy-reward moves from state, calling deal() for new hands. Returns the final score."""
+    for _ in range(depth):
+        if not state.hand:
+            state = state.deal(deal())
+
+        best_move = greedy_reward_move(state)
+        if best_move:
+            state, _ = state.place(*best_move)
+        else:
+            break
+    return state.score
+
+
+def run_rollout_tasks(state, depth, shapes, tasks, deadline=None):
+    """
+    Run (candidate_index, move, seed) rollouts from state, each dealing from its own RNG so
+    the result does not depend on which process runs it. Stops early once time.time()
+    passes the deadline. Returns a list of (candidate_index, score).
+    """
+    results = []
+    for candidate_index, move, seed in tasks:
+        if deadline is not None and time.time() > deadline:
+            break
+        rng = random.Random(seed)
+        start_state, _ = state.place(*move)
+        score = rollout(start_state, depth, lambda: [rng.choice(shapes) for _ in range(3)])
+        results.append((candidate_index, score))
+    return results
+
+
 class LookaheadRolloutAgent:
-    def __init__(self, api, lookahead_depth=4, rollout_depth=4, num_rollouts=5):
+    def __init__(self, api, lookahead_depth=4, rollout_depth=4, num_rollouts=5, workers=0, seed=None,
+                 time_budget=None):
+        """
+        workers > 0 spreads the candidate x rollout work over that many processes.
+        With a seed (or workers) every rollout deals from its own seeded RNG, so the chosen
+        move only depends on the seed. time_budget caps the seconds spent scoring a move;
+        candidates are then ranked on the rollouts that finished in time.
+        """
         self.api = api
         self.lookahead_depth = lookahead_depth
         self.rollout_depth = rollout_depth
         self.num_rollouts = num_rollouts
+        self.workers = workers
+        self.time_budget = time_budget
+        self.rng = random.Random(seed) if seed is not None else None
+        # Unseeded rollouts deal from their own generator rather than the API's, which deals the real
+        # game; it is seeded from the module-level one, so random.seed() still fixes the rollouts
+        self.rollout_rng = random.Random(seed if seed is not None else random.getrandbits(64))
+        self.pool = None
         self.next_shapes = self.api.get_new_shapes(3)  # Initialize with three random shapes
 
     def play_turn(self):
@@ -178,15 +330,18 @@ class LookaheadRolloutAgent:
         best_move = None
         best_score = float('-inf')
 
-        for move in self.get_possible_moves(self.next_shapes, self.lookahead_depth):
-            simulated_api = copy.deepcopy(self.api)
-            simulated_api.next_shapes = self.next_shapes[:]  # Copy current shapes for the simulation
-            score = self.simulate_rollouts(simulated_api, move, self.rollout_depth, self.num_rollouts)
-            
-            if score > best_score:
+        # Rollouts branch off an immutable snapshot, so nothing has to be deep-copied
+        state = GameState.from_api(self.api, self.next_shapes)
+        moves = self.get_possible_moves(self.next_shapes, self.lookahead_depth)
+        for move, score in zip(moves, self.score_moves(state, moves)):
+            if score is not None and score > best_score:
                 best_score = score
                 best_move = move
 
+        # Out of time before any rollout finished: fall back to the first legal move
+        if moves and not best_move:
+            best_move = moves[0]
+
         if best_move:
             shape, position = best_move
             self.api.place_piece(shape, position)
@@ -199,85 +354,154 @@ class LookaheadRolloutAgent:
         if depth == 0 or not shapes:
             return []
         
-        moves = []
-        for shape in shapes:
-            valid_positions = self.api.get_valid_positions(shape)
-            for position in valid_positions:
-                moves.append((shape, position))
+        return [(shape, (x, y)) for shape, x, y in self.api.get_legal_moves(shapes)]
 
-        return moves
+    def score_moves(self, state, moves):
+        """Return the average rollout score of every move, or None for moves left unscored."""
+        deadline = time.time() + self.time_budget if self.time_budget is not None else None
 
-    def simulate_rollouts(self, api, initial_move, depth, num_rollouts):
+        if self.rng is None and not self.workers:
+            scores = []
+            for move in moves:
+                if deadline is not None and time.time() > deadline:
+                    scores.append(None)
+                else:
+                    scores.append(self.simulate_rollouts(state, move, self.rollout_depth, self.num_rollouts))
+            return scores
+
+        turn_seed = (self.rng or random).getrandbits(32)
+        # Rollout-major order, so a time budget leaves every candidate with a similar sample count
+        tasks = [(candidate_index, move, f"{turn_seed}:{candidate_index}:{rollout_index}")
+                 for rollout_index in range(self.num_rollouts) for candidate_index, move in enumerate(moves)]
+        if self.workers:
+            results = self.run_parallel(state, tasks, deadline)
+        else:
+            results = run_rollout_tasks(state, self.rollout_depth, self.api.shapes, tasks, deadline)
+
+        totals = [0] * len(moves)
+        counts = [0] * len(moves)
+        for candidate_index, score in results:
+            totals[candidate_index] += score
+            counts[candidate_index] += 1
+        return [total / count if count else None for total, count in zip(totals, counts)]
+
+    def run_parallel(self, state, tasks, deadline):
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(max_workers=self.workers)
+
+        chunk_size = max(1, len(tasks) // (self.workers * 4))
+        futures = [self.pool.submit(run_rollout_tasks, state, self.rollout_depth, self.api.shapes,
+                                    tasks[i:i + chunk_size], deadline)
+                   for i in range(0, len(tasks), chunk_size)]
+        timeout = max(0, deadline - time.time()) if deadline is not None else None
+        done, not_done = wait(futures, timeout=timeout)
+        for future in not_done:
+            future.cancel()
+        return [result for future in done for result in future.result()]
+
+    def close(self):
+        """Shut down the rollout worker processes, if any were started."""
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+            self.pool = None
+
+    def simulate_rollouts(self, state, initial_move, depth, num_rollouts):
         total_score = 0
+        start_state, _ = state.place(*initial_move)
         for _ in range(num_rollouts):
-            simulated_api = copy.deepcopy(api)
-            simulated_shapes = self.next_shapes[:]  # Copy the shapes for each simulation
-            if initial_move in simulated_shapes:
-                simulated_shapes.remove(initial_move[0])
-                simulated_api.place_piece(*initial_move)
-
-            for _ in range(depth):
-                if not simulated_shapes:
-                    simulated_shapes = simulated_api.get_new_shapes(3)
-
-                best_move = self.heuristic_move(simulated_api, simulated_shapes)
-                if best_move:
-                    shape, position = best_move
-                    simulated_api.place_piece(shape, position)
-                    simulated_shapes.remove(shape)
-                else:
-                    break
-
-            total_score += simulated_api.get_score()
+            total_score += rollout(start_state, depth,
+                                   lambda: [self.rollout_rng.choice(self.api.shapes) for _ in range(3)])
 
         return total_score / num_rollouts
 
-    def heuristic_move(self, api, shapes):
-        best_shape = None
-        best_position = None
-        max_score = float('-inf')
-        for shape in shapes:
-            valid_positions = api.get_valid_positions(shape)
-            for position in valid_positions:
-                simulation = api.simulate_placement(shape, position)
-                reward = simulation[0]
-                hypothetical_board = simulation[1]
-                lines_cleared = simulation[2]
-                if hypothetical_board:
-                    score = reward
-                    if score > max_score:
-                        max_score = score
-                        best_shape = shape
-                        best_position = position
-        return (best_shape, best_position) if best_shape and best_position else None
+    def heuristic_move(self, state):
+        return greedy_reward_move(state)
     
 
+def deduplicated_utilities(evaluate, grids):
+    """
+    Evaluate each distinct occupancy among the grids once, with a single call of evaluate.
+    Returns the utility of every grid and the number of evaluations saved.
+    """
+    indices = {}
+    for index, grid in enumerate(grids):
+        indices.setdefault(grid_to_bits(grid), []).append(index)
+    if len(indices) == len(grids):
+        return evaluate(grids), 0
+
+    utilities = [None] * len(grids)
+    evaluated = evaluate([grids[group[0]] for group in indices.values()])
+    for group, utility in zip(indices.values(), evaluated):
+        for index in group:
+            utilities[index] = utility
+    return utilities, len(grids) - len(indices)
+
+
+def cached_utilities(cache, evaluate, grids):
+    """
+    Look up the CNN utility of every grid in a TranspositionTable and evaluate the misses
+    with a single call of evaluate, e.g. Board.utility_approximation_batch.
+    """
+    keys = [grid_to_bits(grid) for grid in grids]
+    utilities = [cache.get_value(key) for key in keys]
+    missing = {}
+    for index, (key, utility) in enumerate(zip(keys, utilities)):
+        if utility is None:
+            missing.setdefault(key, []).append(index)
+    if missing:
+        evaluated = evaluate([grids[indices[0]] for indices in missing.values()])
+        for (key, indices), utility in zip(missing.items(), evaluated):
+            cache.put_value(key, utility)
+            for index in indices:
+                utilities[index] = utility
+    return utilities
+
+
+def afterstate_utilities(api, cache, evaluate, grids):
+    """
+    CNN utilities of a list of afterstates. Each distinct occupancy is evaluated once, and
+    with a cache only unseen occupancies are evaluated. Without a cache the evaluations
+    saved are added to api.stats.
+    """
+    if cache is None:
+        utilities, saved = deduplicated_utilities(evaluate, grids)
+        api.stats['duplicate_evaluations_skipped'] += saved
+        return utilities
+    return cached_utilities(cache, evaluate, grids)
+
+
 class DeepAgent:
-    def __init__(self, api):
+    def __init__(self, api, cache=None, model_path="game_cnn_model.pth", evaluator=None):
         self.api = api
         self.board = api.board
+        self.cache = cache  # optional TranspositionTable for CNN utilities
+        # Function from a list of grids to their utilities, e.g. InferenceServer.evaluate to
+        # share one model between games; by default the board's own model
+        if evaluator is None:
+            self.board.init_model(model_path)
+            evaluator = self.board.utility_approximation_batch
+        self.evaluator = evaluator
         self.next_shapes = self.api.get_new_shapes(3)  # Initialize with three random shapes
 
+    def utilities(self, grids):
+        return afterstate_utilities(self.api, self.cache, self.evaluator, grids)
+
     def play_turn(self):
-        """Play a single turn using a random move."""
+        """Play a single turn, scoring every afterstate with one batched CNN pass."""
         if not self.next_shapes:  # If no shapes are left, get a new set of three shapes
             self.next_shapes = self.api.get_new_shapes(3)
         
         best_shape = None
         best_position = None
         max_score = float('-inf')
-        for shape in self.next_shapes:
-            valid_positions = self.api.get_valid_positions(shape)
-            for position in valid_positions:
-                simulation = self.api.simulate_placement(shape, position)
-                hypothetical_board = simulation[1]
-                if hypothetical_board:
-                    self.board.init_model()
-                    score = self.board.utility_approximation_cnn(hypothetical_board)
-                    if score > max_score:
-                        max_score = score
-                        best_shape = shape
-                        best_position = position
+        afterstates = self.api.get_afterstates(self.next_shapes)
+        utilities = self.utilities([afterstate[3] for afterstate in afterstates])
+        for (shape, position, reward, hypothetical_board, lines_cleared), utility in zip(afterstates, utilities):
+            score = utility
+            if score > max_score:
+                max_score = score
+                best_shape = shape
+                best_position = position
         if best_shape and best_position:
             self.api.place_piece(best_shape, best_position)
             self.next_shapes.remove(best_shape)
@@ -288,36 +512,441 @@ class DeepAgent:
 
 
 class DeepBellmanAgent:
-    def __init__(self, api):
+    def __init__(self, api, cache=None, model_path="game_cnn_model.pth", evaluator=None):
         self.api = api
         self.board = api.board
+        self.cache = cache  # optional TranspositionTable for CNN utilities
+        # Function from a list of grids to their utilities, e.g. InferenceServer.evaluate to
+        # share one model between games; by default the board's own model
+        if evaluator is None:
+            self.board.init_model(model_path)
+            evaluator = self.board.utility_approximation_batch
+        self.evaluator = evaluator
         self.next_shapes = self.api.get_new_shapes(3)  # Initialize with three random shapes
 
+    def utilities(self, grids):
+        return afterstate_utilities(self.api, self.cache, self.evaluator, grids)
+
     def play_turn(self):
-        """Play a single turn using a random move."""
+        """Play a single turn, scoring every afterstate with one batched CNN pass."""
         if not self.next_shapes:  # If no shapes are left, get a new set of three shapes
             self.next_shapes = self.api.get_new_shapes(3)
         
         best_shape = None
         best_position = None
         max_score = float('-inf')
-        for shape in self.next_shapes:
-            valid_positions = self.api.get_valid_positions(shape)
-            for position in valid_positions:
-                simulation = self.api.simulate_placement(shape, position)
-                reward = simulation[0]
-                hypothetical_board = simulation[1]
-                if hypothetical_board:
-                    score = reward
-                    self.board.init_model()
-                    score += self.board.utility_approximation_cnn(hypothetical_board) * 300
-                    if score > max_score:
-                        max_score = score
-                        best_shape = shape
-                        best_position = position
+        afterstates = self.api.get_afterstates(self.next_shapes)
+        utilities = self.utilities([afterstate[3] for afterstate in afterstates])
+        for (shape, position, reward, hypothetical_board, lines_cleared), utility in zip(afterstates, utilities):
+            score = reward
+            score += utility * 300
+            if score > max_score:
+                max_score = score
+                best_shape = shape
+                best_position = position
         if best_shape and best_position:
             self.api.place_piece(best_shape, best_position)
             self.next_shapes.remove(best_shape)
         else:
             return False
-        return True
\ No newline at end of file
+        return True
+
+
+
+class HandPlannerAgent:
+    def __init__(self, api, beam_width=100, time_budget=1.0, use_cnn=False, model_path=None, evaluator=None):
+        """
+        Plans the placement order and positions of the whole three-piece hand at once.
+        The search runs one level per piece: identical shapes in the hand are expanded
+        once, afterstates reached through different orders are merged on (occupancy,
+        remaining hand), and only the beam_width best sequences by summed reward survive
+        each level. Complete plans are ranked by summed reward plus the shape-capacity
+        heuristic, or plus 300 x the CNN utility with use_cnn. time_budget caps the seconds
+        spent planning a hand.
+        Giving a model_path or an evaluator (as for DeepBellmanAgent) implies use_cnn.
+        """
+        self.api = api
+        self.board = api.board
+        self.beam_width = beam_width
+        self.time_budget = time_budget
+        self.use_cnn = use_cnn or model_path is not None or evaluator is not None
+        if self.use_cnn and evaluator is None:
+            self.board.init_model(model_path or "game_cnn_model.pth")
+            evaluator = self.board.utility_approximation_batch
+        self.evaluator = evaluator
+        self.plan = []
+        self.stats = {'plans': 0, 'expanded': 0, 'merged': 0, 'pruned': 0, 'timeouts': 0}
+        self.next_shapes = self.api.get_new_shapes(3)  # Initialize with three random shapes
+
+    def play_turn(self):
+        """Play the next move of the current hand plan, planning the hand first if needed."""
+        if not self.next_shapes:  # If no shapes are left, get a new set of three shapes
+            self.next_shapes = self.api.get_new_shapes(3)
+
+        if not self.plan or self.plan[0][0] not in self.next_shapes:
+            self.plan = self.plan_hand()
+        if not self.plan:
+            return False
+
+        shape, position = self.plan.pop(0)
+        if not self.api.place_piece(shape, position):
+            self.plan = []
+            return False
+        self.next_shapes.remove(shape)
+        return True
+
+    def plan_hand(self):
+        """Return the best sequence of (shape, position) moves found for the current hand."""
+        self.stats['plans'] += 1
+        deadline = time.time() + self.time_budget if self.time_budget is not None else None
+        root = GameState.from_api(self.api, self.next_shapes)
+
+        # Each frontier entry is (reward_sum, state, moves)
+        frontier = [(0, root, ())]
+        for _ in range(len(root.hand)):
+            children = {}
+            timed_out = False
+            for reward_sum, state, moves in frontier:
+                if deadline is not None and time.time() > deadline:
+                    timed_out = True
+                    break
+                for shape, position, child, reward in state.afterstates():
+                    self.stats['expanded'] += 1
+                    key = (child.bits, tuple(sorted(child.hand)))
+                    total = reward_sum + reward
+                    previous = children.get(key)
+                    if previous is not None:
+                        self.stats['merged'] += 1
+                        if previous[0] >= total:
+                            continue
+                    children[key] = (total, child, moves + ((shape, position),))
+
+            if not children:
+                break
+            ranked = sorted(children.values(), key=lambda entry: entry[0], reverse=True)
+            self.stats['pruned'] += max(0, len(ranked) - self.beam_width)
+            frontier = ranked[:self.beam_width]
+            if timed_out:
+                self.stats['timeouts'] += 1
+                break
+
+        if not frontier[0][2]:
+            return []
+
+        # Prefer plans that place the most pieces, then the best final evaluation
+        most_placed = max(len(moves) for _, _, moves in frontier)
+        finals = [entry for entry in frontier if len(entry[2]) == most_placed]
+        values = self.evaluate([state for _, state, _ in finals])
+        best = max(range(len(finals)), key=lambda i: finals[i][0] + values[i])
+        return list(finals[best][2])
+
+    def evaluate(self, states):
+        if self.use_cnn:
+            utilities = self.evaluator([bits_to_grid(state.bits) for state in states])
+            return [utility * 300 for utility in utilities]
+        return [shape_capacity_bits(state.bits) for state in states]
+
+
+class SearchTimeout(Exception):
+    """Raised inside ExpectimaxAgent's search when the time limit for a move has passed."""
+
+
+class ExpectimaxAgent:
+    def __init__(self, api, max_depth=3, time_limit=0.5, samples=None, seed=0, memo_size=200000):
+        """
+        Depth-limited expectimax over piece placements. Max nodes place a shape from the hand;
+        once the hand is empty a chance node draws the next shape, weighing all 19 shapes
+        equally (the next hand is revealed one piece at a time). With `samples` the chance
+        node instead averages over that many shapes drawn, with an importance weight,
+        in proportion to their size, so the large shapes that end games are rarely missed.
+        Leaves are valued like BellmanAgent: summed rewards plus the shape-capacity heuristic.
+
+        Each move is searched with iterative deepening from depth 1 (equal to BellmanAgent)
+        up to max_depth plies, trying the best move of the previous depth first, until
+        time_limit seconds have passed. Node values are memoized by (occupancy, hand, depth).
+        """
+        self.api = api
+        self.max_depth = max_depth
+        self.time_limit = time_limit
+        self.samples = samples
+        self.seed = seed
+        self.memo = TranspositionTable(memo_size)
+        self.deadline = None
+        self.stats = {'moves': 0, 'nodes': 0, 'timeouts': 0, 'depths': {}}
+        self.next_shapes = self.api.get_new_shapes(3)  # Initialize with three random shapes
+
+        # Importance sampling proposal: proportional to the number of blocks of a shape
+        total_size = sum(SHAPE_SIZES[shape] for shape in self.api.shapes)
+        self.proposal = [SHAPE_SIZES[shape] / total_size for shape in self.api.shapes]
+        self.weights = [1 / (len(self.api.shapes) * p) for p in self.proposal]
+
+    def play_turn(self):
+        if not self.next_shapes:  # If no shapes are left, get a new set of three shapes
+            self.next_shapes = self.api.get_new_shapes(3)
+
+        best_move = self.search(GameState.from_api(self.api, self.next_shapes))
+        if best_move is None:
+            return False
+        shape, position = best_move
+        self.api.place_piece(shape, position)
+        self.next_shapes.remove(shape)
+        return True
+
+    def search(self, state):
+        """Return the best (shape, position) for the state, or None if no shape fits."""
+        moves = list(state.afterstates())
+        if not moves:
+            return None
+        self.stats['moves'] += 1
+        self.deadline = time.time() + self.time_limit if self.time_limit is not None else None
+
+        best_index = 0
+        order = list(range(len(moves)))
+        depth_reached = 0
+        for depth in range(1, self.max_depth + 1):
+            values = {}
+            try:
+                for index in order:
+                    shape, position, child, reward = moves[index]
+                    values[index] = reward + self.value(child, depth - 1)
+            except SearchTimeout:
+                self.stats['timeouts'] += 1
+                # The previous best move was searched first, so a partial iteration that got
+                # past it can only have improved on it
+                if order[0] in values:
+                    best_index = max(values, key=lambda index: (values[index], -order.index(index)))
+                break
+            best_index = max(order, key=lambda index: (values[index], -index))
+            depth_reached = depth
+            # Next depth: best moves of this one first
+            order = sorted(order, key=lambda index: values[index], reverse=True)
+
+        self.stats['depths'][depth_reached] = self.stats['depths'].get(depth_reached, 0) + 1
+        shape, position, _, _ = moves[best_index]
+        return shape, position
+
+    def value(self, state, depth):
+        if depth == 0:
+            return shape_capacity_bits(state.bits)
+        key = (state.bits, tuple(sorted(state.hand)), depth)
+        return self.memo.value(key, lambda: self.expand(state, depth))
+
+    def expand(self, state, depth):
+        if self.deadline is not None and time.time() > self.deadline:
+            raise SearchTimeout()
+        self.stats['nodes'] += 1
+        if not state.hand:
+            return self.chance_value(state, depth)
+
+        best = None
+        for shape, position, child, reward in state.afterstates():
+            value = reward + self.value(child, depth - 1)
+            if best is None or value > best:
+                best = value
+        return best if best is not None else LOSS_VALUE
+
+    def chance_value(self, state, depth):
+        """Expected value over the next shape drawn, exactly or from an importance-weighted sample."""
+        shapes = self.api.shapes
+        if self.samples is None or self.samples >= len(shapes):
+            return sum(self.value(state.deal((shape,)), depth) for shape in shapes) / len(shapes)
+
+        # Seeded by the node, so a memoized value does not depend on the search order
+        rng = random.Random(hash((state.bits, depth, self.seed)))
+        drawn = rng.choices(range(len(shapes)), weights=self.proposal, k=self.samples)
+        total = 0
+        total_weight = 0
+        for index in drawn:
+            total += self.weights[index] * self.value(state.deal((shapes[index],)), depth)
+            total_weight += self.weights[index]
+        return total / total_weight
+
+
+class MCTSAgent:
+    def __init__(self, api, simulations=200, leaf_batch=8, threads=1, exploration=1.4, time_limit=None,
+                 model_path="game_cnn_model.pth", evaluator=None):
+        """
+        Monte-Carlo tree search whose leaves are valued by GameCNN instead of rollouts. The
+        tree lives in an array-backed mcts.NodeStore. Decision nodes place a shape from the
+        hand; a chance node (empty hand) draws the next shape, with every shape equally
+        likely, and is always followed into its least visited outcome.
+
+        Expanding a decision node creates all its afterstates, and their values (300 x the
+        CNN utility, as in DeepBellmanAgent) are computed together: each round selects up to
+        leaf_batch leaves, with virtual loss steering the selections apart, and evaluates all
+        of their children in one forward pass. With threads > 1 several threads search the
+        same tree, each with its own batch in flight. `evaluator` maps a list of grids to
+        utilities, e.g. InferenceServer.evaluate. A search stops after `simulations` leaves
+        or time_limit seconds; the most visited move is played.
+        """
+        self.api = api
+        self.board = api.board
+        self.simulations = simulations
+        self.leaf_batch = leaf_batch
+        self.threads = threads
+        self.exploration = exploration
+        self.time_limit = time_limit
+        if evaluator is None:
+            self.board.init_model(model_path)
+            evaluator = self.board.utility_approximation_batch
+        self.evaluator = evaluator
+        self.lock = threading.Lock()
+        self.stats = {'searches': 0, 'simulations': 0, 'nodes': 0, 'collisions': 0, 'batches': 0}
+        self.next_shapes = self.api.get_new_shapes(3)  # Initialize with three random shapes
+
+    def play_turn(self):
+        if not self.next_shapes:  # If no shapes are left, get a new set of three shapes
+            self.next_shapes = self.api.get_new_shapes(3)
+
+        best_move = self.search(GameState.from_api(self.api, self.next_shapes))
+        if best_move is None:
+            return False
+        shape, position = best_move
+        self.api.place_piece(shape, position)
+        self.next_shapes.remove(shape)
+        return True
+
+    def search(self, state):
+        """Return the most visited (shape, position) at the root, or None if no shape fits."""
+        self.tree = NodeStore()
+        self.paths = {}  # leaf -> path from the root, for leaves whose evaluation is in flight
+        self.value_min = float('inf')
+        self.value_max = float('-inf')
+        self.remaining = self.simulations
+        self.deadline = time.time() + self.time_limit if self.time_limit is not None else None
+
+        root = self.tree.add(-1, state)
+        self.run_round([root])
+        if self.tree.num_children[root] <= 0:
+            return None
+        self.stats['searches'] += 1
+
+        if self.threads > 1:
+            workers = [threading.Thread(target=self.search_worker) for _ in range(self.threads)]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+        else:
+            self.search_worker()
+        self.stats['nodes'] += len(self.tree)
+
+        tree = self.tree
+        best = max(tree.children(root), key=lambda child: (tree.visits[child], self.q_value(child)))
+        return tree.moves[best]
+
+    def search_worker(self):
+        while True:
+            with self.lock:
+                if self.remaining <= 0 or (self.deadline is not None and time.time() > self.deadline):
+                    return
+                leaves = []
+                for _ in range(min(self.leaf_batch, self.remaining)):
+                    self.remaining -= 1
+                    leaf = self.select(0)
+                    if leaf is not None:
+                        leaves.append(leaf)
+            self.run_round(leaves)
+
+    def q_value(self, node, pessimistic=False):
+        """Reward into a node plus its mean value; in-flight simulations count as the worst value seen."""
+        tree = self.tree
+        visits = tree.visits[node]
+        value_sum = tree.value_sum[node]
+        if pessimistic and tree.virtual[node]:
+            visits += tree.virtual[node]
+            value_sum += tree.virtual[node] * self.value_min
+        return tree.reward[node] + (value_sum / visits if visits else 0.0)
+
+    def normalized(self, q):
+        if self.value_max <= self.value_min:
+            return 0.5
+        return min(max((q - self.value_min) / (self.value_max - self.value_min), 0.0), 1.0)
+
+    def select(self, node):
+        """
+        Walk down from node to a leaf to expand, adding virtual loss along the way. Returns
+        the leaf, or None if the walk ended at a terminal node (backed up at once) or at a
+        node whose expansion is still in flight.
+        """
+        tree = self.tree
+        path = [node]
+        while tree.num_children[node] != UNEXPANDED:
+            if tree.num_children[node] == 0:
+                # No shape fits: the game is over here
+                self.stats['simulations'] += 1
+                self.backup(path, LOSS_VALUE)
+                return None
+            children = tree.children(node)
+            if tree.kind[node] == CHANCE:
+                node = min(children, key=lambda child: tree.visits[child] + tree.virtual[child])
+            else:
+                if tree.visits[children[0]] == 0:
+                    # Children created but not evaluated yet
+                    self.stats['collisions'] += 1
+                    return None
+                total = sum(tree.visits[child] + tree.virtual[child] for child in children)
+                scale = self.exploration * math.sqrt(total)
+                node = max(children, key=lambda child: self.normalized(self.q_value(child, True)) +
+                           scale / (1 + tree.visits[child] + tree.virtual[child]))
+            path.append(node)
+
+        if tree.kind[node] == CHANCE:
+            # Chance nodes need no evaluation: add an outcome per shape and go into the first
+            children = tree.add_children(node, [(tree.states[node].deal((shape,)), shape, 0.0)
+                                                for shape in self.api.shapes])
+            node = children[0]
+            path.append(node)
+
+        if tree.virtual[node]:
+            # Already selected for the batch in flight
+            self.stats['collisions'] += 1
+            return None
+        for visited in path:
+            tree.virtual[visited] += 1
+        self.paths[node] = path
+        return node
+
+    def run_round(self, leaves):
+        """Expand the leaves, evaluate all their new children in one batch and back the results up."""
+        tree = self.tree
+        expanded = []
+        with self.lock:
+            for leaf in leaves:
+                children = [(child, (shape, position), reward)
+                            for shape, position, child, reward in tree.states[leaf].afterstates()]
+                expanded.append((leaf, tree.add_children(leaf, children)))
+        grids = [bits_to_grid(tree.states[child].bits) for _, children in expanded for child in children]
+        utilities = self.evaluator(grids) if grids else []
+
+        with self.lock:
+            self.stats['batches'] += 1
+            index = 0
+            for leaf, children in expanded:
+                best = LOSS_VALUE
+                for child in children:
+                    value = utilities[index] * 300
+                    index += 1
+                    tree.visits[child] = 1
+                    tree.value_sum[child] = value
+                    self.track(tree.reward[child] + value)
+                    best = max(best, tree.reward[child] + value)
+                path = self.paths.pop(leaf, [leaf])
+                for visited in path:
+                    if tree.virtual[visited]:
+                        tree.virtual[visited] -= 1
+                self.stats['simulations'] += 1
+                self.backup(path, best)
+
+    def track(self, q):
+        """Widen the range of evaluated move values that q values are normalized to."""
+        self.value_min = min(self.value_min, q)
+        self.value_max = max(self.value_max, q)
+
+    def backup(self, path, value):
+        """Add the value of the last node of the path to every node on it, adding rewards on the way up."""
+        tree = self.tree
+        for node in reversed(path):
+            tree.visits[node] += 1
+            tree.value_sum[node] += value
+            value += tree.reward[node]
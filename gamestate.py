@@ -0,0 +1,66 @@
+# gamestate.py
+
+from board import SHAPE_MASKS, grid_to_bits
+from bitboard import SHAPE_SIZES, simulate_bits
+
+
+class GameState:
+    """
+    Immutable snapshot of a game for the search agents: the occupancy bitboard, the score
+    and the shapes left in the hand. Moves return a new state, so a state can be shared
+    between candidates and rollouts instead of being copied, and the shape tuples in the
+    hand are the shared ones from shapes.ALL_SHAPES.
+    """
+    __slots__ = ('bits', 'score', 'hand')
+
+    def __init__(self, bits=0, score=0, hand=()):
+        self.bits = bits
+        self.score = score
+        self.hand = tuple(hand)
+
+    @classmethod
+    def from_api(cls, api, hand):
+        """Snapshot the board and score of a GameAPI together with an agent's hand."""
+        return cls(grid_to_bits(api.board.grid), api.get_score(), hand)
+
+    def __repr__(self):
+        return f"GameState(bits={self.bits:#x}, score={self.score}, hand={len(self.hand)} shapes)"
+
+    def deal(self, shapes):
+        """Return this state with a new hand."""
+        return GameState(self.bits, self.score, shapes)
+
+    def legal_moves(self):
+        """Return every valid (shape, position) move for the shapes in the hand."""
+        bits = self.bits
+        return [(shape, position) for shape in self.hand
+                for position, mask in SHAPE_MASKS[shape].items() if not bits & mask]
+
+    def afterstates(self):
+        """
+        Yield (shape, position, next_state, reward) for every valid move. Identical shapes
+        in the hand lead to identical afterstates, so each distinct shape is tried once.
+        """
+        bits = self.bits
+        for shape in dict.fromkeys(self.hand):
+            hand = list(self.hand)
+            hand.remove(shape)
+            score = self.score + SHAPE_SIZES[shape]
+            for (x, y), mask in SHAPE_MASKS[shape].items():
+                if not bits & mask:
+                    next_bits, lines_cleared, reward = simulate_bits(bits, shape, x, y)
+                    yield shape, (x, y), GameState(next_bits, score, hand), reward
+
+    def place(self, shape, position):
+        """
+        Play a shape from the hand. Returns (next_state, reward) with the reward of
+        Board.simulate_place_shape, or None if the placement is not valid.
+        """
+        simulation = simulate_bits(self.bits, shape, position[0], position[1])
+        if simulation is None:
+            return None
+        bits, lines_cleared, reward = simulation
+
+        hand = list(self.hand)
+        hand.remove(shape)
+        return GameState(bits, self.score + SHAPE_SIZES[shape], hand), reward
@@ -0,0 +1,72 @@
+# headless.py
+
+import math
+from gameAPI import GameAPI, BellmanAgent
+from board import Board
+from shapes import ALL_SHAPES, SHAPE_COLORS
+from tqdm import tqdm
+import numpy as np
+
+
+def play_one_game(agent, observer=None):
+    """
+    Let the agent play one game to the end without any display.
+    If an observer is given it is called as observer(board, next_shapes, score) whenever a
+    new hand is dealt and after every move; returning False from it ends the game early.
+    Returns one {'board_state', 'remaining_score'} record per turn.
+    """
+    api = agent.api
+    game_board = api.board
+    running = True
+    game_data = []
+    final_score = 0
+
+    while running:
+        # If there are no more shapes to place, get new shapes before continuing
+        if not agent.next_shapes:
+            agent.next_shapes = api.get_new_shapes(3)
+            if observer and observer(game_board, agent.next_shapes, api.get_score()) is False:
+                final_score = api.get_score()
+                break
+
+        current_board_state = [[1 if cell > 0 else 0 for cell in row] for row in game_board.grid]
+        current_score = api.get_score()
+
+        # Let the agent make its move
+        if not agent.play_turn():
+            final_score = api.get_score()
+            running = False
+        elif observer and observer(game_board, agent.next_shapes, api.get_score()) is False:
+            final_score = api.get_score()
+            running = False
+
+        game_data.append({'board_state': current_board_state, 'remaining_score': current_score})
+
+    for turn in game_data:
+        turn['remaining_score'] = final_score - turn['remaining_score']
+
+    return game_data
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank p-th percentile of an ascending list: the smallest value with p% of the values at or below it."""
+    return sorted_values[max(math.ceil(p / 100 * len(sorted_values)) - 1, 0)]
+
+
+def score_five(agent_class=BellmanAgent, board_class=Board, games=5, progress=True, **agent_kwargs):
+    """
+    Play five (or `games`) headless games with a fresh agent and return the average score.
+    Extra keyword arguments are passed to the agent, e.g. model_path for the deep agents.
+    """
+    api = GameAPI(board_class(), ALL_SHAPES, SHAPE_COLORS)
+    agent = agent_class(api, **agent_kwargs)
+    scores = []
+    for i in tqdm(range(games), disable=not progress):
+        game_data = play_one_game(agent)
+        scores.append(game_data[0].get('remaining_score'))
+        api.reset_game()
+    return np.array(scores).mean()
+
+
+if __name__ == "__main__":
+    print(f"Average score: {score_five()}")
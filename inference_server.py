@@ -0,0 +1,264 @@
+# inference_server.py
+
+import argparse
+import itertools
+import multiprocessing
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from board import Board, grid_to_bits, bits_to_grid
+
+
+def collect_batch(requests, max_batch, max_wait):
+    """
+    Block for the first request on the queue, then keep taking requests until they hold
+    max_batch grids or max_wait seconds have passed. Returns (batch, stop), where stop
+    says the None shutdown sentinel was seen.
+    """
+    first = requests.get()
+    if first is None:
+        return [], True
+    batch = [first]
+    size = len(first[1])
+    deadline = time.perf_counter() + max_wait
+    while size < max_batch:
+        timeout = deadline - time.perf_counter()
+        if timeout <= 0:
+            break
+        try:
+            request = requests.get(timeout=timeout)
+        except queue.Empty:
+            break
+        if request is None:
+            return batch, True
+        batch.append(request)
+        size += len(request[1])
+    return batch, False
+
+
+def evaluate_batch(board, batch):
+    """Evaluate the grids of all requests in one forward pass and split the utilities up again per request."""
+    utilities = board.utility_approximation_batch([grid for _, grids in batch for grid in grids])
+    results = []
+    start = 0
+    for _, grids in batch:
+        results.append(utilities[start:start + len(grids)])
+        start += len(grids)
+    return results
+
+
+class InferenceServer:
+    """
+    Serves GameCNN utilities to many games in this process from one model copy. A server
+    thread takes the queued requests, batches them (up to max_batch grids, waiting at most
+    max_wait seconds after the first one) and runs a single forward pass per batch.
+    Pass `server.evaluate` as the evaluator of DeepAgent or DeepBellmanAgent.
+    """
+
+    def __init__(self, model_path="game_cnn_model.pth", max_batch=512, max_wait=0.002):
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.board = Board()
+        self.board.init_model(model_path)
+        self.requests = queue.Queue()
+        self.stats = {'requests': 0, 'batches': 0, 'grids': 0}
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        self.thread.start()
+
+    def serve(self):
+        stop = False
+        while not stop:
+            batch, stop = collect_batch(self.requests, self.max_batch, self.max_wait)
+            if not batch:
+                continue
+            self.stats['requests'] += len(batch)
+            self.stats['batches'] += 1
+            self.stats['grids'] += sum(len(grids) for _, grids in batch)
+            try:
+                results = evaluate_batch(self.board, batch)
+            except Exception as e:
+                for future, _ in batch:
+                    future.set_exception(e)
+                continue
+            for (future, _), utilities in zip(batch, results):
+                future.set_result(utilities)
+
+    def submit(self, grids):
+        """Queue a list of grids; returns a Future of their utilities."""
+        future = Future()
+        if not grids:
+            future.set_result([])
+        else:
+            self.requests.put((future, grids))
+        return future
+
+    def evaluate(self, grids):
+        return self.submit(grids).result()
+
+    def close(self):
+        self.requests.put(None)
+        self.thread.join()
+
+
+def serve_process(model_path, requests, responses, max_batch, max_wait, stats_queue):
+    """
+    Body of the server process of ProcessInferenceServer. Requests are (client, request
+    id, occupancy bits) and answers go to the client's response queue as (request id,
+    utilities) or (request id, exception). The counters are sent on stats_queue at shutdown.
+    """
+    board = Board()
+    board.init_model(model_path)
+    stats = {'requests': 0, 'batches': 0, 'grids': 0}
+    stop = False
+    while not stop:
+        batch, stop = collect_batch(requests, max_batch, max_wait)
+        if not batch:
+            continue
+        batch = [((client, request_id), [bits_to_grid(bits) for bits in grids])
+                 for (client, request_id), grids in batch]
+        stats['requests'] += len(batch)
+        stats['batches'] += 1
+        stats['grids'] += sum(len(grids) for _, grids in batch)
+        try:
+            results = evaluate_batch(board, batch)
+        except Exception as e:
+            results = [e] * len(batch)
+        for ((client, request_id), _), utilities in zip(batch, results):
+            responses[client].put((request_id, utilities))
+    stats_queue.put(stats)
+
+
+class InferenceClient:
+    """
+    Handle on a ProcessInferenceServer for one game process. Grids are sent as occupancy
+    bits, and a receiver thread resolves the Futures returned by submit as answers come in.
+    Create it in the parent and hand it to the worker process when starting it.
+    """
+
+    def __init__(self, client_id, requests, responses):
+        self.client_id = client_id
+        self.requests = requests
+        self.responses = responses
+        self.pending = None
+
+    def start(self):
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.request_ids = itertools.count()
+        threading.Thread(target=self.receive, daemon=True).start()
+
+    def receive(self):
+        while True:
+            request_id, utilities = self.responses.get()
+            with self.lock:
+                future = self.pending.pop(request_id)
+            if isinstance(utilities, Exception):
+                future.set_exception(utilities)
+            else:
+                future.set_result(utilities)
+
+    def submit(self, grids):
+        """Send a list of grids to the server; returns a Future of their utilities."""
+        if self.pending is None:
+            self.start()
+        future = Future()
+        if not grids:
+            future.set_result([])
+            return future
+        request_id = next(self.request_ids)
+        with self.lock:
+            self.pending[request_id] = future
+        self.requests.put(((self.client_id, request_id), [grid_to_bits(grid) for grid in grids]))
+        return future
+
+    def evaluate(self, grids):
+        return self.submit(grids).result()
+
+
+class ProcessInferenceServer:
+    """
+    InferenceServer in its own process, so game processes share one model copy instead of
+    loading one each. clients[i] is the InferenceClient for the i-th game process.
+    """
+
+    def __init__(self, num_clients, model_path="game_cnn_model.pth", max_batch=512, max_wait=0.002):
+        self.stats_queue = multiprocessing.Queue()
+        self.requests = multiprocessing.Queue()
+        responses = [multiprocessing.Queue() for _ in range(num_clients)]
+        self.clients = [InferenceClient(client, self.requests, responses[client]) for client in range(num_clients)]
+        self.process = multiprocessing.Process(target=serve_process, daemon=True,
+                                               args=(model_path, self.requests, responses, max_batch, max_wait,
+                                                     self.stats_queue))
+        self.process.start()
+
+    def close(self):
+        """Stop the server process and return its request, batch and grid counts."""
+        self.requests.put(None)
+        stats = self.stats_queue.get()
+        self.process.join()
+        return stats
+
+
+def play_games(evaluator, games, seed):
+    """Play `games` DeepBellmanAgent games whose CNN calls go to evaluator; returns the final scores."""
+    from gameAPI import GameAPI, DeepBellmanAgent
+    from headless import play_one_game
+    from shapes import ALL_SHAPES, SHAPE_COLORS
+
+    # A generator per call, since concurrent game threads would interleave draws from the module-level one
+    api = GameAPI(Board(), ALL_SHAPES, SHAPE_COLORS, seed=seed)
+    agent = DeepBellmanAgent(api, evaluator=evaluator)
+    scores = []
+    for _ in range(games):
+        scores.append(play_one_game(agent)[0]['remaining_score'])
+        api.reset_game()
+    return scores
+
+
+def play_games_process(client, games, seed, results):
+    results.put(play_games(client.evaluate, games, seed))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Play DeepBellmanAgent games against one shared, batching model.")
+    parser.add_argument('--mode', choices=('thread', 'process'), default='thread')
+    parser.add_argument('--games', type=int, default=32, help="games played concurrently")
+    parser.add_argument('--model', default='game_cnn_model.pth')
+    parser.add_argument('--max-batch', type=int, default=512)
+    parser.add_argument('--max-wait', type=float, default=0.002)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.mode == 'thread':
+        server = InferenceServer(args.model, args.max_batch, args.max_wait)
+        scores = []
+        threads = [threading.Thread(target=lambda seed=seed: scores.extend(play_games(server.evaluate, 1, seed)))
+                   for seed in range(args.games)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        server.close()
+        stats = server.stats
+    else:
+        server = ProcessInferenceServer(args.games, args.model, args.max_batch, args.max_wait)
+        results = multiprocessing.Queue()
+        processes = [multiprocessing.Process(target=play_games_process, args=(client, 1, seed, results))
+                     for seed, client in enumerate(server.clients)]
+        for process in processes:
+            process.start()
+        scores = [score for _ in processes for score in results.get()]
+        for process in processes:
+            process.join()
+        stats = server.close()
+    elapsed = time.perf_counter() - start
+
+    print(f"{len(scores)} games in {elapsed:.1f}s ({len(scores) / elapsed:.2f} games/sec), "
+          f"mean score {sum(scores) / len(scores):.1f}")
+    print(f"{stats['requests']} requests in {stats['batches']} batches, "
+          f"{stats['grids'] / max(stats['batches'], 1):.1f} grids per batch")
+
+
+if __name__ == "__main__":
+    main()
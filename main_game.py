@@ -2,11 +2,12 @@ import pygame
 from gameAPI import GameAPI  # Import the GameAPI class
 from gameAPI import RandomAgent, GreedyHeuristicAgent, BellmanAgent, LookaheadRolloutAgent, DeepAgent, DeepBellmanAgent
 # from policy_x import PolicyXAgent  # Import other agent classes as needed
+from bitboard import BitBoard
 from board import Board, BLOCK_SIZE, BOARD_HEIGHT, BOARD_WIDTH, SCREEN_HEIGHT, SCREEN_WIDTH
 from shapes import ALL_SHAPES, SHAPE_COLORS, COLOR_KEY 
 from tqdm import tqdm
+import headless
 import json
-import numpy as np
 
 # Initialize Pygame
 pygame.init()
@@ -16,7 +17,10 @@ WINDOW_SIZE = (600, 600)
 screen = pygame.display.set_mode(WINDOW_SIZE)
 pygame.display.set_caption('1010 Game')
 
-game_board = Board()
+# BOARD_CLASS = BitBoard
+BOARD_CLASS = Board
+
+game_board = BOARD_CLASS()
 api = GameAPI(game_board, ALL_SHAPES, SHAPE_COLORS)
 
 # AGENT_CLASS = GreedyHeuristicAgent
@@ -84,43 +88,17 @@ draw_game(screen, game_board, agent.next_shapes, api.get_score())
 
 # Main game loop
 
-def play_one_game():
-    running = True
-    game_data = []
-    final_score = 0
-
-    while running:
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                running = False
-
-        # If there are no more shapes to place, get new shapes and draw them before continuing
-        if not agent.next_shapes:
-            agent.next_shapes = agent.api.get_new_shapes(3)  # Get a new set of three shapes
-            # Update the display after each move
-            draw_game(screen, game_board, agent.next_shapes, api.get_score())
-            # Draw the new shapes
-            pygame.display.flip()  # Update the display
-
-        current_board_state = [[1 if cell > 0 else 0 for cell in row] for row in game_board.grid]
-        current_score = api.get_score()
-
-        # Let the agent make its move
-        # pygame.time.delay(100)
-        if not agent.play_turn():
-            final_score = api.get_score()
-            running = False
-        else:
-            # Update the display after each move
-            draw_game(screen, game_board, agent.next_shapes, api.get_score())
-            pygame.display.flip()  # Update the display
-
-        game_data.append({'board_state': current_board_state, 'remaining_score': current_score})
+def render_game(game_board, next_shapes, score):
+    """Observer for headless.play_one_game that redraws the window after every move."""
+    for event in pygame.event.get():
+        if event.type == pygame.QUIT:
+            return False
+    draw_game(screen, game_board, next_shapes, score)
+    return True
 
-    for turn in game_data:
-        turn['remaining_score'] = final_score - turn['remaining_score']
 
-    return game_data
+def play_one_game():
+    return headless.play_one_game(agent, observer=render_game)
 
 
 def append_jsonl(data_list, file_path):
@@ -129,14 +107,6 @@ def append_jsonl(data_list, file_path):
             json_line = json.dumps(data)  # Convert each data item to JSON string
             file.write(json_line + '\n')  # Write JSON string as a new line
 
-def score_five():
-    scores = []
-    for i in tqdm(range(5)):
-        game_data = play_one_game()
-        scores.append(game_data[0].get('remaining_score'))
-        api.reset_game()
-    return np.array(scores).mean()
-
 if __name__ == "__main__":
     scores = []
     file_path = 'game_data.jsonl'  # Use .jsonl extension for JSON Lines format
@@ -0,0 +1,61 @@
+# mcts.py
+
+from array import array
+
+# Node kinds: a decision node places a shape from its hand, a chance node (empty hand) draws the next shape
+DECISION = 0
+CHANCE = 1
+# num_children of a node that has not been expanded yet
+UNEXPANDED = -1
+
+
+class NodeStore:
+    """
+    Search tree for MCTSAgent stored as parallel arrays indexed by node id. The children of
+    a node are added together, so they occupy the ids first_child .. first_child +
+    num_children - 1. Besides the statistics every node keeps its GameState and the move
+    that leads to it from its parent: (shape, position) below a decision node, the drawn
+    shape below a chance node.
+    """
+
+    def __init__(self):
+        self.parent = array('i')
+        self.first_child = array('i')
+        self.num_children = array('i')
+        self.kind = array('b')
+        self.visits = array('i')
+        self.virtual = array('i')  # simulations currently passing through the node
+        self.value_sum = array('d')
+        self.reward = array('d')  # reward of the move from the parent into the node
+        self.states = []
+        self.moves = []
+
+    def __len__(self):
+        return len(self.kind)
+
+    def add(self, parent, state, move=None, reward=0.0):
+        """Append an unexpanded node and return its id."""
+        self.parent.append(parent)
+        self.first_child.append(0)
+        self.num_children.append(UNEXPANDED)
+        self.kind.append(CHANCE if not state.hand else DECISION)
+        self.visits.append(0)
+        self.virtual.append(0)
+        self.value_sum.append(0.0)
+        self.reward.append(reward)
+        self.states.append(state)
+        self.moves.append(move)
+        return len(self.kind) - 1
+
+    def add_children(self, node, children):
+        """Add (state, move, reward) children to a node, marking it expanded. Returns their ids."""
+        first = len(self)
+        for state, move, reward in children:
+            self.add(node, state, move, reward)
+        self.first_child[node] = first
+        self.num_children[node] = len(children)
+        return range(first, len(self))
+
+    def children(self, node):
+        count = max(self.num_children[node], 0)
+        return range(self.first_child[node], self.first_child[node] + count)
@@ -1,5 +1,7 @@
 # model.py
 
+import os
+import time
 import torch.nn as nn
 import torch.nn.functional as F
 import torch
@@ -31,8 +33,97 @@ class GameCNN(nn.Module):
         return x
 
 
+class FoldedGameCNN(nn.Module):
+    """
+    Inference-only GameCNN with each BatchNorm folded into the convolution before it and
+    no dropout, built by export.fold_model. It computes the same values as GameCNN in eval mode.
+    """
+    def __init__(self):
+        super(FoldedGameCNN, self).__init__()
+        self.conv1 = nn.Conv2d(1, 16, kernel_size=3, stride=1, padding=1)
+        self.conv2 = nn.Conv2d(16, 32, kernel_size=3, stride=1, padding=1)
+        self.fc1 = nn.Linear(128, 256)
+        self.fc2 = nn.Linear(256, 1)
+
+    def forward(self, x):
+        x = F.max_pool2d(F.relu(self.conv1(x)), 2)
+        x = F.max_pool2d(F.relu(self.conv2(x)), 2)
+        x = F.relu(self.fc1(x.view(-1, 32 * 2 * 2)))
+        return self.fc2(x)
+
+
 def load_model(model_path):
-    checkpoint = torch.load(model_path)
+    checkpoint = torch.load(model_path, map_location='cpu', weights_only=True)
     model = GameCNN()
     model.load_state_dict(checkpoint['model_state_dict'])
+    # Normalization of the training targets; older checkpoints predate it
+    model.score_mean = checkpoint.get('score_mean', 0.0)
+    model.score_std = checkpoint.get('score_std', 1.0)
+    return model
+
+
+def denormalize(model, outputs):
+    """Map the normalized outputs of a loaded model back to remaining scores."""
+    return outputs * model.score_std + model.score_mean
+
+
+def artifact_paths(model_path):
+    """Paths of the artifacts export.py writes next to a checkpoint."""
+    stem = os.path.splitext(model_path)[0]
+    return {'scripted': stem + '.scripted.pt', 'int8': stem + '.int8.pt', 'numpy': stem + '.npz'}
+
+
+def time_model(model, repeats=20):
+    """Seconds for `repeats` single-board plus `repeats` 128-board forward passes."""
+    single = torch.zeros(1, 1, 10, 10)
+    batch = (torch.rand(128, 1, 10, 10) > 0.5).to(torch.float32)
+    with torch.inference_mode():
+        model(single)
+        model(batch)
+        start = time.perf_counter()
+        for _ in range(repeats):
+            model(single)
+            model(batch)
+    return time.perf_counter() - start
+
+
+def load_preferred_model(model_path, allow_int8=False):
+    """
+    Load the model stored at model_path in eval mode, preferring an exported artifact that
+    is not older than the checkpoint: the int8 one if allow_int8, then the scripted one,
+    then the eager checkpoint itself. The order is fixed rather than timed, so every
+    process picks the same model. Its `artifact` attribute names the choice ('eager',
+    'scripted' or 'int8').
+    """
+    model = load_model(model_path)
+    model.eval()
+    model.artifact = 'eager'
+    paths = artifact_paths(model_path)
+    for name in ('int8', 'scripted') if allow_int8 else ('scripted',):
+        path = paths[name]
+        if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(model_path):
+            artifact = torch.jit.load(path, map_location='cpu')
+            artifact.eval()
+            artifact.artifact = name
+            artifact.score_mean = model.score_mean
+            artifact.score_std = model.score_std
+            return artifact
+    return model
+
+
+# Models already loaded in this process, keyed by checkpoint path and allow_int8
+_MODEL_CACHE = {}
+
+
+def get_model(model_path, allow_int8=False):
+    """
+    Return the preferred version of the model stored at model_path in eval mode (see
+    load_preferred_model), loading it from disk only the first time it is requested in
+    this process.
+    """
+    key = (model_path, allow_int8)
+    model = _MODEL_CACHE.get(key)
+    if model is None:
+        model = load_preferred_model(model_path, allow_int8)
+        _MODEL_CACHE[key] = model
     return model
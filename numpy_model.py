@@ -0,0 +1,65 @@
+# numpy_model.py
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+def conv3x3(x, weight, bias):
+    """3x3 convolution with padding 1 of an (N, C, H, W) array with (O, C, 3, 3) weights."""
+    padded = np.pad(x, ((0, 0), (0, 0), (1, 1), (1, 1)))
+    windows = sliding_window_view(padded, (3, 3), axis=(2, 3))  # (N, C, H, W, 3, 3)
+    out = np.tensordot(windows, weight, axes=([1, 4, 5], [1, 2, 3]))  # (N, H, W, O)
+    return out.transpose(0, 3, 1, 2) + bias[:, None, None]
+
+
+def max_pool2(x):
+    """2x2 max pooling with stride 2, dropping an odd last row and column like F.max_pool2d."""
+    n, c, h, w = x.shape
+    x = x[:, :, :h // 2 * 2, :w // 2 * 2]
+    return x.reshape(n, c, h // 2, 2, w // 2, 2).max(axis=(3, 5))
+
+
+class NumpyGameCNN:
+    """
+    The eval-mode GameCNN forward pass in NumPy, so value estimates need no torch. The
+    weights come from `export.py --numpy`, with each BatchNorm already folded into the
+    convolution before it.
+    """
+    artifact = 'numpy'
+
+    def __init__(self, npz_path):
+        weights = np.load(npz_path)
+        self.conv1_weight = weights['conv1_weight']
+        self.conv1_bias = weights['conv1_bias']
+        self.conv2_weight = weights['conv2_weight']
+        self.conv2_bias = weights['conv2_bias']
+        self.fc1_weight = weights['fc1_weight']
+        self.fc1_bias = weights['fc1_bias']
+        self.fc2_weight = weights['fc2_weight']
+        self.fc2_bias = weights['fc2_bias']
+        self.score_mean = float(weights['score_mean'])
+        self.score_std = float(weights['score_std'])
+
+    def __call__(self, x):
+        """Forward an (N, 1, 10, 10) float32 array of occupancies; returns (N, 1) outputs."""
+        x = max_pool2(np.maximum(conv3x3(x, self.conv1_weight, self.conv1_bias), 0))
+        x = max_pool2(np.maximum(conv3x3(x, self.conv2_weight, self.conv2_bias), 0))
+        x = np.maximum(x.reshape(len(x), -1) @ self.fc1_weight.T + self.fc1_bias, 0)
+        return x @ self.fc2_weight.T + self.fc2_bias
+
+    def utilities(self, grids):
+        """Utility of each grid in a list of Board grids, denormalized as Board.utility_approximation_batch."""
+        boards = (np.array(grids) > 0).astype(np.float32)[:, None]
+        return (self(boards)[:, 0] * self.score_std + self.score_mean).tolist()
+
+
+# Models already loaded in this process, keyed by path
+_MODEL_CACHE = {}
+
+
+def get_numpy_model(npz_path):
+    model = _MODEL_CACHE.get(npz_path)
+    if model is None:
+        model = NumpyGameCNN(npz_path)
+        _MODEL_CACHE[npz_path] = model
+    return model
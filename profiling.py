@@ -0,0 +1,188 @@
+# profiling.py
+
+import argparse
+import json
+import random
+import time
+from collections import Counter, defaultdict
+from shapes import ALL_SHAPES, SHAPE_COLORS
+from gameAPI import GameAPI
+from headless import play_one_game, percentile
+from selfplay import AGENT_CLASSES, BOARD_CLASSES
+
+# (object, method, phase) of every instrumented call; the object is 'agent', 'api' or 'board'
+PHASES = (
+    ('agent', 'play_turn', 'turn'),
+    ('api', 'get_legal_moves', 'move_generation'),
+    ('api', 'get_valid_positions', 'move_generation'),
+    ('board', 'legal_positions', 'move_generation'),
+    ('api', 'get_afterstates', 'simulation'),
+    ('api', 'simulate_placement', 'simulation'),
+    ('board', 'simulate_place_shape', 'simulation'),
+    ('agent', 'heuristic_score', 'heuristic'),
+    ('board', 'heuristic_score', 'heuristic'),
+    ('board', 'shape_capacity', 'heuristic'),
+    ('agent', 'evaluator', 'cnn'),
+    ('board', 'utility_approximation_batch', 'cnn'),
+    ('board', 'utility_approximation_cnn', 'cnn'),
+    ('api', 'place_piece', 'placement'),
+)
+
+
+def count_calls(counters, method_name, args):
+    """Update the grid copy and model counters for one call."""
+    if method_name == 'simulate_place_shape':
+        counters['grid_copies'] += 1
+    elif method_name in ('evaluator', 'utility_approximation_batch'):
+        counters['model_calls'] += 1
+        counters['model_boards'] += len(args[0])
+    elif method_name == 'utility_approximation_cnn':
+        counters['model_calls'] += 1
+        counters['model_boards'] += 1
+
+
+def summarize(timings, counters):
+    """
+    Per-phase call counts, total and mean milliseconds, p50/p95/p99 and share of the turn
+    time, plus the counters. Nested calls within the same phase are timed once, as part of
+    the outermost call.
+    """
+    turn_total = sum(timings.get('turn', ()))
+    phases = {}
+    for phase, durations in timings.items():
+        durations = sorted(durations)
+        total = sum(durations)
+        phases[phase] = {
+            'calls': len(durations),
+            'total_ms': total * 1000,
+            'mean_ms': total / len(durations) * 1000,
+            'p50_ms': percentile(durations, 50) * 1000,
+            'p95_ms': percentile(durations, 95) * 1000,
+            'p99_ms': percentile(durations, 99) * 1000,
+            'share_of_turn': total / turn_total if turn_total else None,
+        }
+    return {'phases': phases, 'counters': dict(counters)}
+
+
+class Profiler:
+    """
+    Opt-in timing of an agent, its GameAPI and board. attach() wraps the methods listed in
+    PHASES on those instances only, so nothing is measured, and nothing costs anything,
+    until a profiler is attached, and detach() restores the originals. Calls are grouped
+    into phases (turn, move_generation, simulation, heuristic, cnn, placement), and grid
+    copies and model invocations are counted. Work done on GameState snapshots or in
+    rollout worker processes is only visible as part of the turn.
+
+    Call end_game() after each game; game_summaries holds a summary per game and
+    aggregate() summarizes all of them.
+    """
+
+    def __init__(self):
+        self.wrapped = []
+        self.game_summaries = []
+        self.all_timings = defaultdict(list)
+        self.all_counters = Counter()
+        self.reset()
+
+    def reset(self):
+        """Discard the measurements of the current game."""
+        self.timings = defaultdict(list)
+        self.counters = Counter()
+        self.active = set()
+
+    def wrap(self, obj, method_name, phase):
+        method = getattr(obj, method_name, None)
+        if method is None or not callable(method):
+            return
+        profiler = self
+
+        def timed(*args, **kwargs):
+            count_calls(profiler.counters, method_name, args)
+            if phase in profiler.active:
+                return method(*args, **kwargs)
+            profiler.active.add(phase)
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                profiler.timings[phase].append(time.perf_counter() - start)
+                profiler.active.discard(phase)
+
+        self.wrapped.append((obj, method_name, obj.__dict__.get(method_name)))
+        setattr(obj, method_name, timed)
+
+    def attach(self, agent):
+        """Instrument an agent together with its api and board."""
+        objects = {'agent': agent, 'api': agent.api, 'board': agent.api.board}
+        for obj_name, method_name, phase in PHASES:
+            self.wrap(objects[obj_name], method_name, phase)
+        return self
+
+    def detach(self):
+        for obj, method_name, original in reversed(self.wrapped):
+            if original is None:
+                delattr(obj, method_name)
+            else:
+                setattr(obj, method_name, original)
+        self.wrapped = []
+
+    def end_game(self, **info):
+        """Close the current game: store its summary (with any extra info, e.g. the score) and start a new one."""
+        summary = summarize(self.timings, self.counters)
+        summary.update(info)
+        self.game_summaries.append(summary)
+        for phase, durations in self.timings.items():
+            self.all_timings[phase].extend(durations)
+        self.all_counters.update(self.counters)
+        self.reset()
+        return summary
+
+    def aggregate(self):
+        summary = summarize(self.all_timings, self.all_counters)
+        summary['games'] = len(self.game_summaries)
+        return summary
+
+    def export(self, path):
+        """Write the per-game summaries and the aggregate as JSON."""
+        with open(path, 'w') as file:
+            json.dump({'games': self.game_summaries, 'aggregate': self.aggregate()}, file, indent=2)
+
+
+def print_summary(summary):
+    print(f"{'phase':<16} {'calls':>8} {'total ms':>10} {'mean ms':>9} {'p50':>8} {'p95':>8} {'p99':>8} {'turn %':>7}")
+    for phase, stats in sorted(summary['phases'].items(), key=lambda item: -item[1]['total_ms']):
+        share = f"{stats['share_of_turn']:.1%}" if stats['share_of_turn'] is not None else '-'
+        print(f"{phase:<16} {stats['calls']:>8} {stats['total_ms']:>10.1f} {stats['mean_ms']:>9.3f} "
+              f"{stats['p50_ms']:>8.3f} {stats['p95_ms']:>8.3f} {stats['p99_ms']:>8.3f} {share:>7}")
+    for counter, value in sorted(summary['counters'].items()):
+        print(f"{counter}: {value}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile where an agent spends its turns.")
+    parser.add_argument('--agent', choices=sorted(AGENT_CLASSES), default='BellmanAgent')
+    parser.add_argument('--board', choices=sorted(BOARD_CLASSES), default='Board')
+    parser.add_argument('--games', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='profile.json')
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    api = GameAPI(BOARD_CLASSES[args.board](), ALL_SHAPES, SHAPE_COLORS)
+    agent = AGENT_CLASSES[args.agent](api)
+    profiler = Profiler().attach(agent)
+    for game in range(args.games):
+        game_data = play_one_game(agent)
+        summary = profiler.end_game(score=game_data[0]['remaining_score'], turns=len(game_data))
+        print(f"Game {game + 1}: score {summary['score']}, {summary['turns']} turns")
+        api.reset_game()
+    profiler.detach()
+
+    print()
+    print_summary(profiler.aggregate())
+    profiler.export(args.output)
+    print(f"Profile written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+# replay.py
+
+import argparse
+import random
+import struct
+import time
+from shapes import ALL_SHAPES, SHAPE_COLORS
+from gameAPI import GameAPI
+from selfplay import AGENT_CLASSES, BOARD_CLASSES, MODEL_AGENTS
+
+# Piece sequence and replay log files start with their magic, a format version and the number of shapes
+SEQUENCE_MAGIC = b'10PS'
+LOG_MAGIC = b'10RL'
+VERSION = 1
+FILE_HEADER = struct.Struct('<4sBBI')  # magic, version, number of shapes, number of games
+SEQUENCE_HEADER = struct.Struct('<I')  # length of one game's sequence
+GAME_HEADER = struct.Struct('<II')  # final score, number of turns
+# One turn of a replay log is 5 bytes: the three hand slots (EMPTY when the hand holds fewer shapes),
+# the index of the shape placed and its cell y * 10 + x. The last turn of a game, where nothing fit,
+# has EMPTY for both.
+TURN = struct.Struct('<5B')
+EMPTY = 0xFF
+# Shapes dealt per game by default; far more than any agent places before losing
+SEQUENCE_LENGTH = 30000
+
+
+def generate_sequence(seed, length=SEQUENCE_LENGTH, num_shapes=len(ALL_SHAPES)):
+    """Uniformly drawn shape indices for one game, as bytes."""
+    rng = random.Random(seed)
+    return bytes(rng.randrange(num_shapes) for _ in range(length))
+
+
+def write_games(path, magic, num_shapes, games, write_game):
+    with open(path, 'wb') as file:
+        file.write(FILE_HEADER.pack(magic, VERSION, num_shapes, len(games)))
+        for game in games:
+            write_game(file, game)
+
+
+def read_games(path, magic, read_game):
+    """Return the number of shapes and the games of a sequence or log file."""
+    with open(path, 'rb') as file:
+        file_magic, version, num_shapes, count = FILE_HEADER.unpack(file.read(FILE_HEADER.size))
+        if file_magic != magic or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} {magic.decode()} file")
+        return num_shapes, [read_game(file) for _ in range(count)]
+
+
+def save_sequences(path, sequences, num_shapes=len(ALL_SHAPES)):
+    def write_game(file, sequence):
+        file.write(SEQUENCE_HEADER.pack(len(sequence)))
+        file.write(sequence)
+
+    write_games(path, SEQUENCE_MAGIC, num_shapes, sequences, write_game)
+
+
+def load_sequences(path):
+    """Return the piece sequences of a file written by save_sequences."""
+    def read_game(file):
+        length, = SEQUENCE_HEADER.unpack(file.read(SEQUENCE_HEADER.size))
+        return file.read(length)
+
+    return read_games(path, SEQUENCE_MAGIC, read_game)[1]
+
+
+def save_log(path, games, num_shapes=len(ALL_SHAPES)):
+    """Write (score, turns) games, turns being the TURN records returned by play_recorded_game."""
+    def write_game(file, game):
+        score, turns = game
+        file.write(GAME_HEADER.pack(score, len(turns) // TURN.size))
+        file.write(turns)
+
+    write_games(path, LOG_MAGIC, num_shapes, games, write_game)
+
+
+def load_log(path):
+    def read_game(file):
+        score, turns = GAME_HEADER.unpack(file.read(GAME_HEADER.size))
+        return score, file.read(turns * TURN.size)
+
+    return read_games(path, LOG_MAGIC, read_game)[1]
+
+
+def play_recorded_game(agent, sequence=None, seed=None):
+    """
+    Let the agent play one headless game and record it. The shapes come from the piece
+    sequence if one is given, otherwise from the API's RNG, reseeded with seed if given. A
+    seed also reseeds agents that draw from their own generators (RandomAgent,
+    LookaheadRolloutAgent), so the game only depends on the workload. Returns the final
+    score and the game's TURN records as bytes.
+    """
+    api = agent.api
+    api.reset_game(seed)
+    api.set_sequence(sequence)
+    if seed is not None:
+        if getattr(agent, 'rng', None) is not None:
+            agent.rng = random.Random(seed)
+        if hasattr(agent, 'rollout_rng'):
+            agent.rollout_rng = random.Random(seed)
+    index = {shape: i for i, shape in enumerate(api.shapes)}
+    agent.next_shapes = []  # drop what is left of the previous game's hand
+    api.recording = placed = []
+    turns = bytearray()
+
+    while True:
+        if not agent.next_shapes:
+            agent.next_shapes = api.get_new_shapes(3)
+        hand = [index[shape] for shape in agent.next_shapes] + [EMPTY] * (3 - len(agent.next_shapes))
+        moves = len(placed)
+        if not agent.play_turn() or len(placed) == moves:
+            turns += TURN.pack(*hand, EMPTY, EMPTY)
+            break
+        shape, (x, y) = placed[-1]
+        turns += TURN.pack(*hand, index[shape], y * 10 + x)
+
+    api.recording = None
+    api.set_sequence(None)
+    return api.get_score(), bytes(turns)
+
+
+def replay_game(turns, board_class=BOARD_CLASSES['BitBoard'], shapes=ALL_SHAPES):
+    """
+    Play the moves of a recorded game again without any agent, checking that every move is
+    from its hand and legal. Returns the final score.
+    """
+    api = GameAPI(board_class(), shapes, SHAPE_COLORS, seed=0)
+    for turn, (*hand, shape, cell) in enumerate(TURN.iter_unpack(turns)):
+        if shape == EMPTY:
+            break
+        if shape not in hand:
+            raise ValueError(f"turn {turn} places shape {shape}, which is not in its hand {hand}")
+        if not api.place_piece(shapes[shape], (cell % 10, cell // 10)):
+            raise ValueError(f"turn {turn} places shape {shape} on occupied cells at {cell}")
+    return api.get_score()
+
+
+def compare_agents(agent_names, sequences, board_name='BitBoard', model_path=None):
+    """
+    Play every piece sequence with each agent. Returns {agent name: (games, seconds)}
+    where games is a list of (score, turns) as stored by save_log.
+    """
+    results = {}
+    for agent_name in agent_names:
+        api = GameAPI(BOARD_CLASSES[board_name](), ALL_SHAPES, SHAPE_COLORS, seed=0)
+        agent_kwargs = {'model_path': model_path} if model_path and agent_name in MODEL_AGENTS else {}
+        agent = AGENT_CLASSES[agent_name](api, **agent_kwargs)
+        start = time.perf_counter()
+        games = [play_recorded_game(agent, sequence, seed) for seed, sequence in enumerate(sequences)]
+        results[agent_name] = (games, time.perf_counter() - start)
+        if hasattr(agent, 'close'):
+            agent.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate piece sequences, play agents on them and replay the logs.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    generate = commands.add_parser('generate', help="write seeded piece sequences")
+    generate.add_argument('--games', type=int, default=20)
+    generate.add_argument('--seed', type=int, default=0, help="game i uses seed + i")
+    generate.add_argument('--length', type=int, default=SEQUENCE_LENGTH, help="shapes per game")
+    generate.add_argument('--output', default='pieces.bin')
+
+    play = commands.add_parser('play', help="play agents on the same piece sequences and log their games")
+    play.add_argument('--pieces', default='pieces.bin')
+    play.add_argument('--agents', nargs='+', choices=sorted(AGENT_CLASSES), default=['BellmanAgent'])
+    play.add_argument('--board', choices=sorted(BOARD_CLASSES), default='BitBoard')
+    play.add_argument('--model', default=None, help="model for the deep agents")
+    play.add_argument('--log-prefix', default='replay', help="logs are written to <prefix>.<agent>.bin")
+
+    replay = commands.add_parser('replay', help="replay logged games at full speed and check their scores")
+    replay.add_argument('log')
+    replay.add_argument('--board', choices=sorted(BOARD_CLASSES), default='BitBoard')
+    args = parser.parse_args()
+
+    if args.command == 'generate':
+        save_sequences(args.output, [generate_sequence(args.seed + game, args.length) for game in range(args.games)])
+        print(f"{args.games} piece sequences of {args.length} shapes written to {args.output}")
+
+    elif args.command == 'play':
+        sequences = load_sequences(args.pieces)
+        results = compare_agents(args.agents, sequences, args.board, args.model)
+        for agent_name, (games, seconds) in results.items():
+            scores = [score for score, _ in games]
+            turns = sum(len(game_turns) // TURN.size for _, game_turns in games)
+            path = f"{args.log_prefix}.{agent_name}.bin"
+            save_log(path, games)
+            print(f"{agent_name:<24} mean score {sum(scores) / len(scores):>9.1f}, {turns} turns in {seconds:.1f}s "
+                  f"({turns / seconds:.1f} turns/sec), log {path}")
+        if len(results) > 1:
+            print("\nScores per piece sequence:")
+            print(f"{'game':>5} " + " ".join(f"{name:>24}" for name in results))
+            for game in range(len(sequences)):
+                print(f"{game:>5} " + " ".join(f"{games[game][0]:>24}" for games, _ in results.values()))
+
+    else:
+        games = load_log(args.log)
+        board_class = BOARD_CLASSES[args.board]
+        start = time.perf_counter()
+        mismatches = sum(replay_game(turns, board_class) != score for score, turns in games)
+        seconds = time.perf_counter() - start
+        turns = sum(len(game_turns) // TURN.size for _, game_turns in games)
+        print(f"{len(games)} games, {turns} turns replayed in {seconds:.2f}s ({turns / seconds:.0f} turns/sec), "
+              f"{mismatches} score mismatches")
+        if mismatches:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+# selfplay.py
+
+import argparse
+import json
+import multiprocessing
+import random
+import time
+import numpy as np
+from gameAPI import GameAPI
+from gameAPI import RandomAgent, GreedyHeuristicAgent, BellmanAgent, LookaheadRolloutAgent, DeepAgent, DeepBellmanAgent
+from gameAPI import HandPlannerAgent, ExpectimaxAgent, MCTSAgent
+from board import Board
+from bitboard import BitBoard
+from shapes import ALL_SHAPES, SHAPE_COLORS
+from headless import play_one_game
+from transposition import TranspositionTable
+
+AGENT_CLASSES = {cls.__name__: cls for cls in (RandomAgent, GreedyHeuristicAgent, BellmanAgent,
+                                                LookaheadRolloutAgent, HandPlannerAgent, DeepAgent,
+                                                DeepBellmanAgent, ExpectimaxAgent, MCTSAgent)}
+BOARD_CLASSES = {cls.__name__: cls for cls in (Board, BitBoard)}
+# Agents that can look up afterstate values in a TranspositionTable
+CACHING_AGENTS = {'GreedyHeuristicAgent', 'BellmanAgent', 'DeepAgent', 'DeepBellmanAgent'}
+# Agents that evaluate positions with GameCNN and take a model_path (HandPlannerAgent switches to the CNN with one)
+MODEL_AGENTS = {'DeepAgent', 'DeepBellmanAgent', 'HandPlannerAgent', 'MCTSAgent'}
+
+
+def shard_path(output_prefix, worker_id):
+    return f"{output_prefix}.shard-{worker_id:03d}.jsonl"
+
+
+def run_worker(worker_id, games, agent_name, board_name, seed, output_prefix, cache_size=0, model_path=None):
+    """
+    Play `games` games in this process with its own board, API and agent, appending every
+    turn to the worker's shard. With a cache_size the API and agent share a per-process
+    TranspositionTable, and a model_path (e.g. a NumPy .npz export) replaces the default
+    checkpoint of the deep agents. Returns the final score of each game, the sample count,
+    the cache statistics (or None) and the API's move deduplication counts.
+    """
+    # GameAPI and the agents draw from the module-level generator, which is per process
+    random.seed(seed + worker_id)
+    cache = TranspositionTable(cache_size) if cache_size else None
+    api = GameAPI(BOARD_CLASSES[board_name](), ALL_SHAPES, SHAPE_COLORS, cache=cache)
+    agent_kwargs = {}
+    if cache is not None and agent_name in CACHING_AGENTS:
+        agent_kwargs['cache'] = cache
+    if model_path and agent_name in MODEL_AGENTS:
+        agent_kwargs['model_path'] = model_path
+    agent = AGENT_CLASSES[agent_name](api, **agent_kwargs)
+
+    scores = []
+    samples = 0
+    with open(shard_path(output_prefix, worker_id), 'a') as file:
+        for _ in range(games):
+            game_data = play_one_game(agent)
+            scores.append(game_data[0].get('remaining_score'))
+            file.writelines(json.dumps(data) + '\n' for data in game_data)
+            samples += len(game_data)
+            api.reset_game()
+    return scores, samples, cache.stats() if cache is not None else None, api.stats
+
+
+def generate(games, workers, agent_name='BellmanAgent', board_name='BitBoard', seed=0,
+             output_prefix='game_data', cache_size=0, model_path=None):
+    """
+    Spread `games` self-play games over `workers` processes, one JSONL shard per worker.
+    Returns a summary with throughput, the distribution of final scores, the move
+    deduplication counts and, with a cache_size, the transposition cache counters, both
+    summed over workers.
+    """
+    if games < 1 or workers < 1:
+        raise ValueError(f"need at least one game and one worker, got {games} games and {workers} workers")
+    games_per_worker = [games // workers + (1 if i < games % workers else 0) for i in range(workers)]
+    jobs = [(worker_id, count, agent_name, board_name, seed, output_prefix, cache_size, model_path)
+            for worker_id, count in enumerate(games_per_worker) if count]
+
+    start = time.perf_counter()
+    with multiprocessing.Pool(len(jobs)) as pool:
+        results = pool.starmap(run_worker, jobs)
+    elapsed = time.perf_counter() - start
+
+    scores = np.array([score for worker_scores, _, _, _ in results for score in worker_scores])
+    samples = sum(worker_samples for _, worker_samples, _, _ in results)
+    histogram, bin_edges = np.histogram(scores, bins=10)
+    cache_stats = None
+    if cache_size:
+        counters = ('value_hits', 'value_misses', 'position_hits', 'position_misses')
+        cache_stats = {counter: sum(stats[counter] for _, _, stats, _ in results) for counter in counters}
+    dedupe_stats = {counter: sum(stats[counter] for _, _, _, stats in results) for counter in results[0][3]}
+    return {
+        'games': len(scores),
+        'samples': samples,
+        'seconds': elapsed,
+        'games_per_sec': len(scores) / elapsed,
+        'samples_per_sec': samples / elapsed,
+        'score_mean': float(scores.mean()),
+        'score_std': float(scores.std()),
+        'score_min': int(scores.min()),
+        'score_max': int(scores.max()),
+        'score_percentiles': {p: float(np.percentile(scores, p)) for p in (10, 25, 50, 75, 90)},
+        'score_histogram': list(zip(bin_edges[:-1].tolist(), histogram.tolist())),
+        'shards': [shard_path(output_prefix, job[0]) for job in jobs],
+        'cache': cache_stats,
+        'dedupe': dedupe_stats,
+    }
+
+
+def print_summary(summary):
+    print(f"{summary['games']} games, {summary['samples']} samples in {summary['seconds']:.1f}s "
+          f"({summary['games_per_sec']:.2f} games/sec, {summary['samples_per_sec']:.1f} samples/sec)")
+    print(f"Score mean {summary['score_mean']:.1f}, std {summary['score_std']:.1f}, "
+          f"min {summary['score_min']}, max {summary['score_max']}")
+    print("Percentiles: " + ", ".join(f"p{p}={v:.0f}" for p, v in summary['score_percentiles'].items()))
+    for low, count in summary['score_histogram']:
+        print(f"  {low:>8.0f}+ {'#' * count} {count}")
+    dedupe = summary['dedupe']
+    print(f"Moves generated: {dedupe['moves']}, evaluations saved: {dedupe['duplicate_moves_skipped']} "
+          f"duplicate-shape moves, {dedupe['duplicate_evaluations_skipped']} duplicate afterstates")
+    cache = summary['cache']
+    if cache:
+        for table in ('value', 'position'):
+            hits, misses = cache[f'{table}_hits'], cache[f'{table}_misses']
+            rate = hits / (hits + misses) if hits + misses else 0.0
+            print(f"Cache {table}s: {hits} hits, {misses} misses ({rate:.1%} hit rate)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate self-play data on all cores.")
+    parser.add_argument('--games', type=int, default=100)
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count())
+    parser.add_argument('--agent', choices=sorted(AGENT_CLASSES), default='BellmanAgent')
+    parser.add_argument('--board', choices=sorted(BOARD_CLASSES), default='BitBoard')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='game_data', help="shard path prefix")
+    parser.add_argument('--cache', type=int, default=0, help="transposition cache entries per worker (0 disables it); "
+                             "it only saves time for the CNN agents")
+    parser.add_argument('--model', default=None,
+                        help="model for the deep agents: a .pth checkpoint or a NumPy .npz export")
+    args = parser.parse_args()
+    if args.games < 1 or args.workers < 1:
+        parser.error("--games and --workers must be at least 1")
+
+    summary = generate(args.games, args.workers, args.agent, args.board, args.seed, args.output, args.cache,
+                       args.model)
+    print_summary(summary)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,321 @@
+# test_board.py
+
+import random
+import numpy as np
+import pytest
+from board import Board, BOARD_WIDTH, BOARD_HEIGHT, grid_to_bits, bits_to_grid, legal_placement_bits
+from bitboard import BitBoard
+from batchenv import BatchEnv, shape_capacity_batch
+from gameAPI import GameAPI, GreedyHeuristicAgent, BellmanAgent
+from gamestate import GameState
+from replay import (generate_sequence, save_sequences, load_sequences, save_log, load_log, play_recorded_game,
+                    replay_game, compare_agents)
+from shapes import ALL_SHAPES, SHAPE_COLORS
+from transposition import TranspositionTable
+
+BOARD_CLASSES = (Board, BitBoard)
+
+
+# Straightforward versions of the board rules the faster backends have to reproduce:
+# rows are cleared before columns are checked, and the density bonus is counted after clearing.
+
+def ref_can_place(grid, shape, x, y):
+    for row in range(len(shape)):
+        for col in range(len(shape[row])):
+            if shape[row][col]:
+                if row + y >= BOARD_HEIGHT or col + x >= BOARD_WIDTH or grid[row + y][col + x] != 0:
+                    return False
+    return True
+
+
+def ref_clear(grid):
+    lines_cleared = 0
+    for row in range(BOARD_HEIGHT):
+        if all(grid[row][col] != 0 for col in range(BOARD_WIDTH)):
+            grid[row] = [0] * BOARD_WIDTH
+            lines_cleared += 1
+    for col in range(BOARD_WIDTH):
+        if all(grid[row][col] != 0 for row in range(BOARD_HEIGHT)):
+            for row in range(BOARD_HEIGHT):
+                grid[row][col] = 0
+            lines_cleared += 1
+    return lines_cleared
+
+
+def ref_simulate(grid, shape, x, y, color):
+    if not ref_can_place(grid, shape, x, y):
+        return None
+    grid = [row[:] for row in grid]
+    cells = [(row, col) for row in range(len(shape)) for col in range(len(shape[row])) if shape[row][col]]
+    for row, col in cells:
+        grid[row + y][col + x] = color
+    lines_cleared = ref_clear(grid)
+    density = sum(sum(1 for block in grid[row + y] if block) + sum(1 for line in grid if line[col + x])
+                  for row, col in cells)
+    return grid, lines_cleared, (lines_cleared * 10 - len(cells)) * 100 + density * 10
+
+
+def ref_capacity(grid):
+    inverted = [[0 if cell else 1 for cell in row] for row in grid]
+    return sum(1 for x in range(BOARD_WIDTH - 1) for y in range(BOARD_HEIGHT - 1) for shape in ALL_SHAPES
+               if ref_can_place(inverted, shape, x, y))
+
+
+def ref_positions(grid, shape):
+    return [(x, y) for x in range(BOARD_WIDTH) for y in range(BOARD_HEIGHT) if ref_can_place(grid, shape, x, y)]
+
+
+def random_grid(rng):
+    """
+    A random grid like the ones reached in play, which never hold a complete line, with a
+    row or column one cell short of complete so placements clear lines.
+    """
+    fill = rng.choice((0.2, 0.5, 0.8))
+    grid = [[rng.randint(1, 5) if rng.random() < fill else 0 for _ in range(BOARD_WIDTH)] for _ in range(BOARD_HEIGHT)]
+    line = rng.randrange(BOARD_HEIGHT)
+    if rng.random() < 0.5:
+        grid[line] = [rng.randint(1, 5) for _ in range(BOARD_WIDTH)]
+        grid[line][rng.randrange(BOARD_WIDTH)] = 0
+    else:
+        for row in grid:
+            row[line] = rng.randint(1, 5)
+        grid[rng.randrange(BOARD_HEIGHT)][line] = 0
+    for row in range(BOARD_HEIGHT):
+        if all(grid[row]):
+            grid[row][rng.randrange(BOARD_WIDTH)] = 0
+    for col in range(BOARD_WIDTH):
+        if all(row[col] for row in grid):
+            grid[rng.randrange(BOARD_HEIGHT)][col] = 0
+    return grid
+
+
+def make_board(board_class, grid):
+    board = board_class()
+    board.grid = [row[:] for row in grid]
+    return board
+
+
+@pytest.mark.parametrize('board_class', BOARD_CLASSES)
+def test_primitives_match_reference(board_class):
+    rng = random.Random(0)
+    for _ in range(150):
+        grid = random_grid(rng)
+        board = make_board(board_class, grid)
+        assert board.shape_capacity(board.grid) == ref_capacity(grid)
+        assert board.grid == grid  # shape_capacity leaves the grid alone
+        for shape in ALL_SHAPES:
+            assert sorted(board.legal_positions(shape)) == ref_positions(grid, shape)
+            assert board.game_over([shape]) == (not ref_positions(grid, shape))
+            for x in range(BOARD_WIDTH):
+                for y in range(BOARD_HEIGHT):
+                    assert board.can_place_shape(shape, x, y) == ref_can_place(grid, shape, x, y)
+                    simulated = board.simulate_place_shape(shape, x, y, 7)
+                    expected = ref_simulate(grid, shape, x, y, 7)
+                    if expected is None:
+                        assert simulated is None
+                    else:
+                        assert [list(row) for row in simulated[0]] == expected[0]
+                        assert simulated[1:] == expected[1:]
+        assert board.grid == grid  # simulating leaves the board alone
+
+
+@pytest.mark.parametrize('board_class', BOARD_CLASSES)
+def test_clear_complete_lines_matches_reference(board_class):
+    rng = random.Random(1)
+    for _ in range(150):
+        grid = random_grid(rng)
+        # clear_complete_lines runs right after a placement has completed lines
+        grid[rng.randrange(BOARD_HEIGHT)] = [1] * BOARD_WIDTH
+        if rng.random() < 0.5:
+            for row in grid:
+                row[rng.randrange(BOARD_WIDTH)] = 1
+        board = make_board(board_class, grid)
+        expected = [row[:] for row in grid]
+        assert board.clear_complete_lines() == ref_clear(expected)
+        assert board.grid == expected
+
+
+@pytest.mark.parametrize('board_class', BOARD_CLASSES)
+def test_incremental_state_matches_grid(board_class):
+    """Play random moves and check the fill counters and legal-placement masks against a fresh computation."""
+    rng = random.Random(2)
+    board = board_class()
+    expected = [[0] * BOARD_WIDTH for _ in range(BOARD_HEIGHT)]
+    for _ in range(3000):
+        shape = rng.choice(ALL_SHAPES)
+        positions = ref_positions(expected, shape)
+        if not positions:
+            assert board.game_over([shape])
+            board.clear_board()
+            expected = [[0] * BOARD_WIDTH for _ in range(BOARD_HEIGHT)]
+            continue
+        x, y = rng.choice(positions)
+        assert board.place_shape(shape, x, y, 3) is not False
+        expected = ref_simulate(expected, shape, x, y, 3)[0]
+
+        assert board.grid == expected
+        assert board.row_counts == [sum(1 for cell in row if cell) for row in expected]
+        assert board.col_counts == [sum(1 for row in expected if row[col]) for col in range(BOARD_WIDTH)]
+        assert board.filled == sum(board.row_counts)
+        bits = grid_to_bits(expected)
+        assert board.occupancy == bits
+        hand = rng.sample(ALL_SHAPES, 3)
+        masks = board.legal_placement_masks(hand)
+        assert masks == [legal_placement_bits(bits, shape) for shape in hand]
+        assert board.game_over(hand) == all(not ref_positions(expected, shape) for shape in hand)
+
+
+def test_bitboard_simulated_grid_survives_later_moves():
+    """BitBoard builds simulated grids lazily from the board's rows; later moves must not leak into them."""
+    rng = random.Random(3)
+    board = BitBoard()
+    expected = [[0] * BOARD_WIDTH for _ in range(BOARD_HEIGHT)]
+    pending = []
+    for _ in range(1000):
+        shape = rng.choice(ALL_SHAPES)
+        positions = ref_positions(expected, shape)
+        if not positions:
+            board.clear_board()
+            expected = [[0] * BOARD_WIDTH for _ in range(BOARD_HEIGHT)]
+            continue
+        x, y = rng.choice(positions)
+        pending.append((board.simulate_place_shape(shape, x, y, 9)[0], ref_simulate(expected, shape, x, y, 9)[0]))
+        board.place_shape(shape, x, y, 3)
+        expected = ref_simulate(expected, shape, x, y, 3)[0]
+    for simulated, simulated_expected in pending:
+        assert [list(row) for row in simulated] == simulated_expected
+        assert simulated.bits == grid_to_bits(simulated_expected)
+
+
+def test_gamestate_matches_reference():
+    """GameState moves and afterstates against the reference rules, over random games."""
+    rng = random.Random(4)
+    grid = [[0] * BOARD_WIDTH for _ in range(BOARD_HEIGHT)]
+    state = GameState(hand=rng.sample(ALL_SHAPES, 3))
+    for _ in range(1500):
+        assert state.bits == grid_to_bits(grid)
+        expected_moves = [(shape, position) for shape in state.hand for position in ref_positions(grid, shape)]
+        assert sorted(state.legal_moves()) == sorted(expected_moves)
+        afterstates = list(state.afterstates())
+        assert sorted((shape, position) for shape, position, _, _ in afterstates) == sorted(set(expected_moves))
+        for shape, (x, y), next_state, reward in afterstates:
+            expected_grid, _, expected_reward = ref_simulate(grid, shape, x, y, 1)
+            assert (next_state.bits, reward) == (grid_to_bits(expected_grid), expected_reward)
+            assert next_state.score == state.score + sum(map(sum, shape))
+
+        if not expected_moves:
+            grid = [[0] * BOARD_WIDTH for _ in range(BOARD_HEIGHT)]
+            state = GameState(hand=rng.sample(ALL_SHAPES, 3))
+            continue
+        shape, (x, y) = rng.choice(expected_moves)
+        expected_grid, _, expected_reward = ref_simulate(grid, shape, x, y, 1)
+        state, reward = state.place(shape, (x, y))
+        assert reward == expected_reward
+        grid = expected_grid
+        if not state.hand:
+            state = state.deal(rng.sample(ALL_SHAPES, 3))
+        assert bits_to_grid(state.bits) == [[1 if cell else 0 for cell in row] for row in grid]
+
+
+def test_batchenv_matches_reference():
+    """BatchEnv steps every game like the reference rules, and shape_capacity_batch matches shape_capacity."""
+    env = BatchEnv(8, seed=5)
+    for _ in range(100):
+        grids = env.grids.tolist()
+        hands = env.hands.copy()
+        legal = env.legal_moves()
+        for game in range(env.num_games):
+            for slot, index in enumerate(hands[game]):
+                expected = np.zeros((BOARD_HEIGHT, BOARD_WIDTH), dtype=bool)
+                if index >= 0 and not env.done[game]:
+                    for x, y in ref_positions(grids[game], ALL_SHAPES[index]):
+                        expected[y, x] = True
+                assert (legal[game, slot] == expected).all()
+        assert shape_capacity_batch(env.grids > 0).tolist() == [ref_capacity(grid) for grid in grids]
+
+        slots, xs, ys = env.sample_random_moves()
+        rewards, lines_cleared, valid = env.step(slots, xs, ys)
+        for game in range(env.num_games):
+            if slots[game] < 0:
+                assert not valid[game]
+                assert env.grids[game].tolist() == grids[game]
+                continue
+            shape = ALL_SHAPES[hands[game, slots[game]]]
+            expected_grid, expected_lines, expected_reward = ref_simulate(grids[game], shape, xs[game], ys[game],
+                                                                          SHAPE_COLORS[shape])
+            assert valid[game]
+            assert env.grids[game].tolist() == expected_grid
+            assert (lines_cleared[game], rewards[game]) == (expected_lines, expected_reward)
+        env.reset(env.done)
+
+
+def test_transposition_table():
+    table = TranspositionTable(maxsize=2)
+    calls = []
+    assert table.value(1, lambda: calls.append(1) or 10) == 10
+    assert table.value(1, lambda: calls.append(1) or 11) == 10
+    assert table.value(2, lambda: 20) == 20
+    table.get_value(1)  # 1 is now the most recently used entry, so 2 is evicted next
+    table.put_value(3, 30)
+    assert (table.get_value(1), table.get_value(2), table.get_value(3)) == (10, None, 30)
+    assert calls == [1]
+    assert table.legal_positions(0, ALL_SHAPES[0], lambda: [(0, 0)]) == [(0, 0)]
+    assert table.legal_positions(0, ALL_SHAPES[0], lambda: []) == [(0, 0)]
+    stats = table.stats()
+    assert (stats['value_hits'], stats['value_misses'], stats['position_hits'], stats['position_misses']) == (4, 3, 1, 1)
+
+
+@pytest.mark.parametrize('agent_class', (GreedyHeuristicAgent, BellmanAgent))
+def test_cached_agent_plays_like_uncached(agent_class):
+    """A TranspositionTable shared by the API and agent must not change a single move."""
+    sequence = generate_sequence(6)
+    games = []
+    for cache in (None, TranspositionTable(1000)):
+        agent = agent_class(GameAPI(BitBoard(), ALL_SHAPES, SHAPE_COLORS, cache=cache, seed=0), cache=cache)
+        games.append(play_recorded_game(agent, sequence, seed=6))
+    assert games[0] == games[1]
+
+
+def test_numpy_model_matches_torch(tmp_path):
+    """The NumPy export of a normalized checkpoint gives the torch model's utilities."""
+    torch = pytest.importorskip('torch')
+    from model import GameCNN, load_model
+    from export import fold_model, save_numpy_weights
+
+    torch.manual_seed(0)
+    model = GameCNN()
+    for norm in (model.bn1, model.bn2):
+        norm.running_mean.uniform_(-0.5, 0.5)
+        norm.running_var.uniform_(0.5, 2.0)
+    checkpoint_path = str(tmp_path / 'model.pth')
+    torch.save({'model_state_dict': model.state_dict(), 'score_mean': 500.0, 'score_std': 40.0}, checkpoint_path)
+    loaded = load_model(checkpoint_path)
+    save_numpy_weights(fold_model(loaded), loaded.score_mean, loaded.score_std, str(tmp_path / 'model.npz'))
+
+    torch_board, numpy_board = Board(), Board()
+    torch_board.init_model(checkpoint_path)
+    numpy_board.init_model(str(tmp_path / 'model.npz'))
+    rng = random.Random(7)
+    grids = [random_grid(rng) for _ in range(64)]
+    expected = torch_board.utility_approximation_batch(grids)
+    assert numpy_board.utility_approximation_batch(grids) == pytest.approx(expected, abs=1e-3)
+    assert numpy_board.utility_approximation_cnn(grids[0]) == pytest.approx(expected[0], abs=1e-3)
+    assert torch_board.utility_approximation_cnn(grids[0]) == pytest.approx(expected[0], abs=1e-3)
+
+
+def test_replay_round_trip(tmp_path):
+    """Sequences and logs survive a save and load, and replaying a log reproduces every score."""
+    sequences = [generate_sequence(seed) for seed in range(3)]
+    save_sequences(tmp_path / 'pieces.bin', sequences)
+    assert load_sequences(tmp_path / 'pieces.bin') == sequences
+
+    results = compare_agents(['GreedyHeuristicAgent', 'RandomAgent'], sequences)
+    for agent_name, (games, _) in results.items():
+        path = tmp_path / f'{agent_name}.bin'
+        save_log(path, games)
+        assert load_log(path) == games
+        for score, turns in games:
+            for board_class in BOARD_CLASSES:
+                assert replay_game(turns, board_class) == score
+    # Playing the same sequences again gives the same games
+    assert compare_agents(['RandomAgent'], sequences)['RandomAgent'][0] == results['RandomAgent'][0]
@@ -1,12 +1,19 @@
 # train.py
 
+import argparse
+import multiprocessing
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
 import torch
 import torch.optim as optim
 import torch.nn as nn
 import matplotlib.pyplot as plt
 from dataLoaders import get_data_loaders
 from model import GameCNN
-from main_game import score_five
+from headless import score_five
+from selfplay import AGENT_CLASSES, MODEL_AGENTS
 
 def validate_model(model, val_loader, criterion):
     model.eval()
@@ -18,20 +25,77 @@ def validate_model(model, val_loader, criterion):
             total_loss += loss.item()
     return total_loss / len(val_loader)
 
+def evaluate_checkpoint(snapshot_path, agent_name, games):
+    """
+    Runs in the evaluation process: play `games` games with the agent on the checkpoint
+    snapshot and return the average score. The snapshot is removed afterwards.
+    """
+    # Leave the cores to the training process
+    torch.set_num_threads(1)
+    try:
+        if agent_name in MODEL_AGENTS:
+            return score_five(AGENT_CLASSES[agent_name], games=games, progress=False, model_path=snapshot_path)
+        return score_five(AGENT_CLASSES[agent_name], games=games, progress=False)
+    finally:
+        os.remove(snapshot_path)
+
+def report_evaluations(evaluations, block=False):
+    """Print the finished evaluations (all of them with block) and return those still running."""
+    running = []
+    for epoch, future in evaluations:
+        if block or future.done():
+            print(f"Epoch {epoch} Game Score: {future.result()}")
+        else:
+            running.append((epoch, future))
+    return running
+
 def main():
+    parser = argparse.ArgumentParser(description="Train GameCNN on self-play data.")
+    parser.add_argument('--data', default='game_data_heuristic.jsonl', help="JSONL file or packed dataset prefix")
+    parser.add_argument('--batch-size', type=int, default=512)
+    parser.add_argument('--test-size', type=float, default=0.01)
+    parser.add_argument('--epochs', type=int, default=15)
+    parser.add_argument('--lr', type=float, default=0.00005)
+    parser.add_argument('--model-path', default='game_cnn_model.pth')
+    parser.add_argument('--workers', type=int, default=2, help="DataLoader worker processes")
+    parser.add_argument('--prefetch', type=int, default=4, help="batches prefetched per worker")
+    parser.add_argument('--pin-memory', action='store_true')
+    parser.add_argument('--threads', type=int, default=None,
+                        help="torch intra-op threads (default: the cores left after loader and evaluation workers)")
+    parser.add_argument('--eval-every', type=int, default=5, help="epochs between evaluations (0 disables them)")
+    parser.add_argument('--eval-games', type=int, default=5)
+    parser.add_argument('--eval-agent', choices=sorted(AGENT_CLASSES), default='DeepBellmanAgent')
+    args = parser.parse_args()
+
+    threads = args.threads
+    if threads is None:
+        threads = max(1, multiprocessing.cpu_count() - args.workers - (1 if args.eval_every else 0))
+    torch.set_num_threads(threads)
+
     # train_loader, val_loader = get_data_loaders('game_data.jsonl', batch_size=2048, test_size=0.2)
-    train_loader, val_loader = get_data_loaders('game_data_heuristic.jsonl', batch_size=512, test_size=0.01)
+    train_loader, val_loader = get_data_loaders(args.data, batch_size=args.batch_size, test_size=args.test_size,
+                                                num_workers=args.workers, prefetch_factor=args.prefetch,
+                                                pin_memory=args.pin_memory)
     model = GameCNN()
     criterion = nn.MSELoss()
     # optimizer = optim.Adam(model.parameters(), lr=0.00005)  # Smaller learning rate
-    optimizer = optim.Adam(model.parameters(), lr=0.00005)
+    optimizer = optim.Adam(model.parameters(), lr=args.lr)
+
+    # Evaluation games run in a separate process on a snapshot of the checkpoint, so training
+    # continues meanwhile; spawn keeps the child clear of the parent's torch threads
+    evaluator = None
+    if args.eval_every:
+        evaluator = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn'))
+    evaluations = []
 
     train_losses = []
     val_losses = []
-    game_score = 0
-    for epoch in range(15):
+    print(f"Training with {threads} torch threads and {args.workers} loader workers")
+    for epoch in range(args.epochs):
+        epoch_start = time.perf_counter()
         model.train()
         running_loss = 0.0
+        samples = 0
         for inputs, labels in train_loader:
             optimizer.zero_grad()
             outputs = model(inputs)
@@ -39,6 +103,8 @@ def main():
             loss.backward()
             optimizer.step()
             running_loss += loss.item()
+            samples += len(inputs)
+        train_seconds = time.perf_counter() - epoch_start
 
         train_loss = running_loss / len(train_loader)
         val_loss = validate_model(model, val_loader, criterion)
@@ -46,16 +112,25 @@ def main():
         train_losses.append(train_loss)
         val_losses.append(val_loss)
 
-        model_path = "game_cnn_model.pth"
         torch.save({
             'model_state_dict': model.state_dict(),
             'model_architecture': GameCNN.__name__,
-        }, model_path)
-        if epoch % 5 == 0:
-            game_score = score_five()
-        print(f"Epoch {epoch+1}, Training Loss: {train_loss}, Validation Loss: {val_loss}, Game Score: {game_score}")
-
+            'score_mean': float(train_loader.dataset.score_mean),
+            'score_std': float(train_loader.dataset.score_std),
+        }, args.model_path)
+        if evaluator and epoch % args.eval_every == 0:
+            snapshot_path = f"{args.model_path}.epoch-{epoch+1:03d}"
+            shutil.copyfile(args.model_path, snapshot_path)
+            evaluations.append((epoch + 1, evaluator.submit(evaluate_checkpoint, snapshot_path, args.eval_agent,
+                                                            args.eval_games)))
+        epoch_seconds = time.perf_counter() - epoch_start
+        print(f"Epoch {epoch+1}, Training Loss: {train_loss}, Validation Loss: {val_loss}, "
+              f"{samples / train_seconds:.0f} samples/sec, {epoch_seconds:.1f}s")
+        evaluations = report_evaluations(evaluations)
 
+    if evaluator:
+        report_evaluations(evaluations, block=True)
+        evaluator.shutdown()
 
     plt.figure(figsize=(10, 5))
     plt.plot(train_losses, label='Training Loss')
@@ -67,4 +142,4 @@ def main():
     plt.show()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
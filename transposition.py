@@ -0,0 +1,82 @@
+# transposition.py
+
+from collections import OrderedDict
+
+
+class TranspositionTable:
+    """
+    Bounded LRU cache keyed by the binary occupancy of a board (see board.grid_to_bits), so
+    boards that differ only in colors share an entry. It keeps two tables: evaluated values
+    of afterstates, and legal positions per (occupancy, shape). Hit and miss counts are
+    kept for both so the benefit can be measured.
+    """
+
+    def __init__(self, maxsize=200000):
+        self.maxsize = maxsize
+        self.values = OrderedDict()
+        self.positions = OrderedDict()
+        self.value_hits = 0
+        self.value_misses = 0
+        self.position_hits = 0
+        self.position_misses = 0
+
+    def _lookup(self, table, key):
+        entry = table.get(key)
+        if entry is not None:
+            table.move_to_end(key)
+        return entry
+
+    def _store(self, table, key, entry):
+        table[key] = entry
+        if len(table) > self.maxsize:
+            table.popitem(last=False)
+
+    def get_value(self, bits):
+        """Return the cached value of an occupancy, or None."""
+        value = self._lookup(self.values, bits)
+        if value is None:
+            self.value_misses += 1
+        else:
+            self.value_hits += 1
+        return value
+
+    def put_value(self, bits, value):
+        self._store(self.values, bits, value)
+
+    def value(self, bits, compute):
+        """Return the value of an occupancy, calling compute() only on a cache miss."""
+        value = self.get_value(bits)
+        if value is None:
+            value = compute()
+            self.put_value(bits, value)
+        return value
+
+    def legal_positions(self, bits, shape, compute):
+        """Return the legal positions of a shape on an occupancy, calling compute() only on a cache miss."""
+        key = (bits, shape)
+        positions = self._lookup(self.positions, key)
+        if positions is None:
+            self.position_misses += 1
+            positions = compute()
+            self._store(self.positions, key, positions)
+        else:
+            self.position_hits += 1
+        return positions
+
+    def clear(self):
+        self.values.clear()
+        self.positions.clear()
+
+    def stats(self):
+        """Return hit/miss counts and hit rates of both tables."""
+        value_lookups = self.value_hits + self.value_misses
+        position_lookups = self.position_hits + self.position_misses
+        return {
+            'value_hits': self.value_hits,
+            'value_misses': self.value_misses,
+            'value_hit_rate': self.value_hits / value_lookups if value_lookups else 0.0,
+            'position_hits': self.position_hits,
+            'position_misses': self.position_misses,
+            'position_hit_rate': self.position_hits / position_lookups if position_lookups else 0.0,
+            'entries': len(self.values) + len(self.positions),
+        }